@@ -40,6 +40,10 @@ def test_get_supported_aggregations(client, mock_stac_io):
     supported_aggregations = client.get_supported_aggregations()
     assert supported_aggregations == ["aggregation1", "aggregation2"]
 
+    # The supported aggregations are only fetched once
+    assert client.get_supported_aggregations() == ["aggregation1", "aggregation2"]
+    assert mock_stac_io.read_json.call_count == 1
+
 
 @patch(
     "titiler.stacapi.pystac.advanced_client.Client.get_supported_aggregations",
@@ -42,3 +42,22 @@ def test_stac_collections(rio, get_assets, app):
     assert resp["minzoom"] == 12
     assert resp["maxzoom"] == 14
     assert "?assets=cog" in resp["tiles"][0]
+
+    response = app.get(
+        "/collections/noaa-emergency-response/WebMercatorQuad/tilejson.json",
+        params={
+            "assets": "cog",
+            "bbox": "-87.0,36.0,-86.0,37.0",
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["bounds"] == [-87.0, 36.0, -86.0, 37.0]
+
+    response = app.get(
+        "/collections/noaa-emergency-response/WebMercatorQuad/tilejson.json",
+        params={
+            "assets": "cog",
+            "bbox": "-87.0,36.0,-86.0",
+        },
+    )
+    assert response.status_code == 400
@@ -1,10 +1,35 @@
 """test titiler-pgstac dependencies."""
 
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pystac
+import pytest
+import requests
+from fastapi import HTTPException
+from pystac_client.exceptions import APIError
 from starlette.requests import Request
 
 from titiler.stacapi import dependencies
 from titiler.stacapi.enums import MediaType
 
+item_json = os.path.join(
+    os.path.dirname(__file__), "fixtures", "46_033111301201_1040010082988200.json"
+)
+
+
+def _response(status_code, content=b"", headers=None):
+    """Create a requests Response."""
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = content
+    resp.headers.update(headers or {})
+    return resp
+
 
 def test_media_type():
     """test accept_media_type dependency."""
@@ -50,6 +75,22 @@ def test_media_type():
         == MediaType.json
     )
 
+    assert (
+        dependencies.accept_media_type(
+            "*/*",
+            [MediaType.html, MediaType.json],
+        )
+        == MediaType.html
+    )
+
+    assert (
+        dependencies.accept_media_type(
+            "",
+            [MediaType.json, MediaType.html],
+        )
+        == MediaType.json
+    )
+
 
 def test_output_type():
     """test OutputType dependency."""
@@ -85,10 +126,22 @@ def test_output_type():
         == MediaType.html
     )
 
+    # No accept header, return the first media type
     req = Request(
         {"type": "http", "client": None, "query_string": "", "headers": ()}, None
     )
-    assert not dependencies.OutputType(req)
+    assert dependencies.OutputType(req) == MediaType.json
+
+    req = Request(
+        {
+            "type": "http",
+            "client": None,
+            "query_string": "",
+            "headers": ((b"accept", b"*/*"),),
+        },
+        None,
+    )
+    assert dependencies.OutputType(req) == MediaType.json
 
     # FastAPI will parse the request first and inject `f=json` in the dependency
     req = Request(
@@ -101,3 +154,160 @@ def test_output_type():
         None,
     )
     assert dependencies.OutputType(req, f="json") == MediaType.json
+
+
+@patch("titiler.stacapi.dependencies._fetch_stac_item")
+def test_get_stac_item_not_found(fetch_stac_item, monkeypatch):
+    """Failed requests don't leave their lock behind."""
+    monkeypatch.setattr(dependencies.cache_config, "ttl", 60)
+    monkeypatch.setattr(dependencies.cache_config, "maxsize", 4)
+    fetch_stac_item.side_effect = HTTPException(404, "Could not find Item")
+
+    with pytest.raises(HTTPException):
+        dependencies.get_stac_item("http://something.stac", "collection", "item")
+
+    assert not dependencies._item_requests
+
+
+@patch("titiler.stacapi.dependencies._fetch_stac_item")
+def test_get_stac_item_concurrent(fetch_stac_item, monkeypatch):
+    """Concurrent calls share the fetched Item, even when it expires right away."""
+    monkeypatch.setattr(dependencies.cache_config, "ttl", 60)
+    monkeypatch.setattr(dependencies.cache_config, "maxsize", 4)
+    monkeypatch.setattr(dependencies, "_item_cache", dependencies.OrderedDict())
+
+    with open(item_json, "r") as f:
+        item = pystac.Item.from_dict(json.loads(f.read()))
+
+    fetched = threading.Event()
+
+    def fetch(*args, **kwargs):
+        fetched.set()
+        time.sleep(0.2)
+        # `Cache-Control: no-cache`
+        return (time.monotonic(), None, item)
+
+    fetch_stac_item.side_effect = fetch
+
+    def get_item():
+        return dependencies.get_stac_item("http://something.stac", "collection", "item")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(get_item)
+        fetched.wait()
+        others = [executor.submit(get_item) for _ in range(3)]
+        assert all(f.result() is item for f in [first, *others])
+
+    assert fetch_stac_item.call_count == 1
+
+    # The Item expired, the next call fetches it again
+    assert get_item() is item
+    assert fetch_stac_item.call_count == 2
+
+
+@patch("titiler.stacapi.dependencies.stac_api_get")
+def test_fetch_stac_item_quote_ids(stac_api_get):
+    """Item and Collection ids are quoted in the Item URL."""
+    with open(item_json, "rb") as f:
+        stac_api_get.return_value = _response(200, f.read())
+
+    dependencies._fetch_stac_item("http://something.stac", "a/b", "a?x=1#frag")
+    assert (
+        stac_api_get.call_args.args[1]
+        == "http://something.stac/collections/a%2Fb/items/a%3Fx%3D1%23frag"
+    )
+
+
+@patch("titiler.stacapi.dependencies.stac_api_get")
+def test_get_stac_item_revalidate(stac_api_get, monkeypatch):
+    """Expired Items are revalidated with their ETag."""
+    monkeypatch.setattr(dependencies.cache_config, "ttl", 60)
+    monkeypatch.setattr(dependencies.cache_config, "maxsize", 4)
+    monkeypatch.setattr(dependencies, "_item_cache", dependencies.OrderedDict())
+
+    with open(item_json, "rb") as f:
+        stac_api_get.return_value = _response(
+            200, f.read(), headers={"ETag": '"v1"', "Cache-Control": "max-age=0"}
+        )
+
+    item = dependencies.get_stac_item("http://something.stac", "collection", "item")
+    assert item.id == "46_033111301201_1040010082988200"
+    assert stac_api_get.call_args.kwargs["headers"] is None
+
+    # The Item expired (`max-age=0`), the STAC API says it didn't change
+    stac_api_get.return_value = _response(304)
+    item_304 = dependencies.get_stac_item("http://something.stac", "collection", "item")
+    assert item_304 is item
+    assert stac_api_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert stac_api_get.call_count == 2
+
+    # The 304 response has no `Cache-Control`, the Item is now cached for `ttl`
+    assert (
+        dependencies.get_stac_item("http://something.stac", "collection", "item")
+        is item
+    )
+    assert stac_api_get.call_count == 2
+
+
+def test_cache_ttl(monkeypatch):
+    """Item TTL is capped by the STAC API Cache-Control header."""
+    monkeypatch.setattr(dependencies.cache_config, "ttl", 60)
+
+    assert dependencies._cache_ttl(None) == 60
+    assert dependencies._cache_ttl("public") == 60
+    assert dependencies._cache_ttl("max-age=10") == 10
+    assert dependencies._cache_ttl("public, max-age=3600") == 60
+    assert dependencies._cache_ttl("no-cache") == 0
+    assert dependencies._cache_ttl("private, no-store") == 0
+
+
+@patch("titiler.stacapi.dependencies.stac_api_get")
+def test_fetch_stac_item_max_age(stac_api_get, monkeypatch):
+    """`max-age` above the cache TTL is capped."""
+    monkeypatch.setattr(dependencies.cache_config, "ttl", 60)
+
+    with open(item_json, "rb") as f:
+        stac_api_get.return_value = _response(
+            200, f.read(), headers={"Cache-Control": "max-age=3600"}
+        )
+
+    before = time.monotonic()
+    expires_at, etag, item = dependencies._fetch_stac_item(
+        "http://something.stac", "collection", "item"
+    )
+    assert before + 60 <= expires_at <= time.monotonic() + 60
+    assert etag is None
+    assert item.id == "46_033111301201_1040010082988200"
+
+
+@pytest.mark.parametrize("status_code", [404, 405])
+@patch("titiler.stacapi.dependencies.ItemSearch")
+@patch("titiler.stacapi.dependencies.stac_api_get")
+def test_fetch_stac_item_search(stac_api_get, item_search, status_code):
+    """Fallback to `/search` when the Item endpoint isn't available."""
+    with open(item_json, "r") as f:
+        item = pystac.Item.from_dict(json.loads(f.read()))
+
+    stac_api_get.return_value = _response(status_code)
+    item_search.return_value.items.return_value = iter([item])
+
+    _, etag, found = dependencies._fetch_stac_item(
+        "http://something.stac", "collection", "item"
+    )
+    assert found is item
+    assert etag is None
+    assert item_search.call_args.args[0] == "http://something.stac/search"
+    assert item_search.call_args.kwargs["collections"] == ["collection"]
+    assert item_search.call_args.kwargs["ids"] == ["item"]
+
+    # Not found
+    item_search.return_value.items.return_value = iter([])
+    with pytest.raises(HTTPException) as e:
+        dependencies._fetch_stac_item("http://something.stac", "collection", "item")
+
+    assert e.value.status_code == 404
+
+    # Other errors are raised
+    stac_api_get.return_value = _response(500)
+    with pytest.raises(APIError):
+        dependencies._fetch_stac_item("http://something.stac", "collection", "item")
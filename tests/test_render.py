@@ -1,13 +1,25 @@
 """test render extension."""
 
+import copy
 import json
 import os
+import time
 from unittest.mock import patch
 
 import pystac
+import requests
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+from pystac_client.exceptions import APIError
 
 from titiler.core import dependencies
-from titiler.stacapi.factory import get_dependency_params, get_layer_from_collections
+from titiler.stacapi import factory
+from titiler.stacapi.factory import (
+    get_dependency_params,
+    get_layer,
+    get_layer_from_collections,
+)
+from titiler.stacapi.utils import get_stac_api_io
 
 catalog_json = os.path.join(os.path.dirname(__file__), "fixtures", "catalog.json")
 
@@ -31,6 +43,9 @@ def test_render(client):
     assert visual["bbox"]
     assert visual["tilematrixsets"]["WebMercatorQuad"]
     assert visual["time"]
+    assert visual["time"][0] in visual["time"]
+    assert visual["time"][-1] in visual["time"]
+    assert "1900-01-01" not in visual["time"]
     assert visual["render"]["asset_bidx"]
 
     color = collections_render["MAXAR_BayofBengal_Cyclone_Mocha_May_23_color"]["render"]
@@ -51,3 +66,210 @@ def test_render(client):
         query_params=visualr,
     )
     assert rescale
+
+
+@patch("titiler.stacapi.factory.Client")
+def test_get_layer(client, monkeypatch):
+    """test get_layer."""
+    monkeypatch.setattr(factory, "_layers_cache", LRUCache(maxsize=0))
+
+    with open(catalog_json, "r") as f:
+        collections = {
+            c["id"]: pystac.Collection.from_dict(c)
+            for c in json.loads(f.read())["collections"]
+        }
+
+    def get_collection(collection_id):
+        if collection_id not in collections:
+            err = APIError("Not Found")
+            err.status_code = 404
+            raise err
+
+        return collections[collection_id]
+
+    client.open.return_value.get_collection.side_effect = get_collection
+    client.open.return_value.get_collections.return_value = list(collections.values())
+
+    layer = get_layer(
+        "https://something.stac", "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual"
+    )
+    assert layer["id"] == "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual"
+    assert layer["collection"] == "MAXAR_BayofBengal_Cyclone_Mocha_May_23"
+    assert client.open.return_value.get_collection.call_count == 1
+    client.open.return_value.get_collections.assert_not_called()
+
+    assert not get_layer(
+        "https://something.stac", "MAXAR_BayofBengal_Cyclone_Mocha_May_23_yo"
+    )
+
+
+def _response(status_code, content=b"", headers=None):
+    """Create a requests Response."""
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = content
+    resp.headers.update(headers or {})
+    return resp
+
+
+def test_collections_etags():
+    """The `/collections` ETags are recorded by a response hook."""
+    stac_api_io = get_stac_api_io({"x-test": "collections-etags"})
+    etags = factory._collections_etags(stac_api_io)
+    assert factory._collections_etags(stac_api_io) is etags
+    hooks = stac_api_io.session.hooks["response"]
+    assert hooks.count(hooks[-1]) == 1
+
+    def send(url, status_code=200):
+        resp = _response(status_code, headers={"ETag": '"v1"'})
+        resp.request = requests.Request("GET", url).prepare()
+        for hook in hooks:
+            hook(resp)
+
+    send("https://something.stac/collections")
+    send("https://something.stac/search")
+    send("https://other.stac/collections", status_code=304)
+    assert etags == {"https://something.stac/collections": '"v1"'}
+
+    # Paginated collections can't be revalidated
+    send("https://something.stac/collections?token=next:2")
+    assert etags == {"https://something.stac/collections": None}
+
+
+def test_has_static_times():
+    """Layers with dynamic times are not revalidated."""
+    with open(catalog_json, "r") as f:
+        collection = json.loads(f.read())["collections"][0]
+
+    assert factory._has_static_times(pystac.Collection.from_dict(collection))
+
+    open_ended = copy.deepcopy(collection)
+    open_ended["extent"]["temporal"]["interval"] = [["2023-01-03T04:30:17Z", None]]
+    assert not factory._has_static_times(pystac.Collection.from_dict(open_ended))
+
+    aggregation = copy.deepcopy(collection)
+    aggregation["renders"]["visual"]["aggregation"] = {
+        "name": "datetime_frequency",
+        "params": {"precision": {"days": 1}},
+    }
+    assert not factory._has_static_times(pystac.Collection.from_dict(aggregation))
+
+    # Times from `cube:dimensions` only depend on the Collection
+    aggregation["cube:dimensions"] = {"time": {"values": ["2023-01-03T04:30:17Z"]}}
+    assert factory._has_static_times(pystac.Collection.from_dict(aggregation))
+
+
+@patch("titiler.stacapi.factory.stac_api_get")
+@patch("titiler.stacapi.factory.Client")
+def test_get_layer_from_collections_revalidate(client, stac_api_get, monkeypatch):
+    """Expired Layers are revalidated with the `/collections` ETag."""
+    monkeypatch.setattr(factory, "_layers_cache", LRUCache(maxsize=4))
+    monkeypatch.setattr(factory.cache_config, "ttl", 60)
+
+    with open(catalog_json, "r") as f:
+        catalog = json.loads(f.read())
+
+    collections = [pystac.Collection.from_dict(c) for c in catalog["collections"]]
+    client.open.return_value.get_collections.return_value = collections
+    get_collections = client.open.return_value.get_collections
+
+    url = "https://something.stac"
+    headers = {"x-test": "layers-revalidate"}
+    etags = factory._collections_etags(get_stac_api_io(headers))
+    etags[f"{url}/collections"] = '"v1"'
+
+    layers = get_layer_from_collections(url, headers)
+    assert len(layers) == 4
+    assert get_collections.call_count == 1
+
+    key = hashkey(url, frozenset(headers.items()))
+    expires_at, etag, _ = factory._layers_cache[key]
+    assert etag == '"v1"'
+
+    # Cached
+    assert get_layer_from_collections(url, headers) is layers
+    stac_api_get.assert_not_called()
+
+    # Expired, the STAC API returns `304`
+    factory._layers_cache[key] = (time.monotonic() - 1, etag, layers)
+    stac_api_get.return_value = _response(304)
+    assert get_layer_from_collections(url, headers) is layers
+    assert stac_api_get.call_args.args[1] == f"{url}/collections"
+    assert stac_api_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert get_collections.call_count == 1
+    assert factory._layers_cache[key][0] > time.monotonic()
+
+    # Expired, the (non-paginated) `200` response is used to build the layers
+    factory._layers_cache[key] = (time.monotonic() - 1, etag, layers)
+    stac_api_get.return_value = _response(
+        200, json.dumps({**catalog, "links": []}).encode()
+    )
+    new_layers = get_layer_from_collections(url, headers)
+    assert new_layers is not layers
+    assert new_layers.keys() == layers.keys()
+    assert get_collections.call_count == 1
+
+    # Expired, paginated `200` response, the collections are listed
+    factory._layers_cache[key] = (time.monotonic() - 1, etag, layers)
+    stac_api_get.return_value = _response(
+        200,
+        json.dumps(
+            {**catalog, "links": [{"rel": "next", "href": f"{url}/collections?p=2"}]}
+        ).encode(),
+    )
+    assert get_layer_from_collections(url, headers) is not layers
+    assert get_collections.call_count == 2
+
+    # Paginated collections (no ETag) are never revalidated
+    etags[f"{url}/collections"] = None
+    factory._layers_cache.clear()
+    get_layer_from_collections(url, headers)
+    assert factory._layers_cache[key][1] is None
+
+    stac_api_get.reset_mock()
+    factory._layers_cache[key] = (time.monotonic() - 1, None, layers)
+    get_layer_from_collections(url, headers)
+    stac_api_get.assert_not_called()
+    assert get_collections.call_count == 4
+
+
+@patch("titiler.stacapi.factory.stac_api_get")
+@patch("titiler.stacapi.factory.Client")
+def test_get_layer_from_collections_dynamic_times(client, stac_api_get, monkeypatch):
+    """Layers with dynamic times are always rebuilt."""
+    monkeypatch.setattr(factory, "_layers_cache", LRUCache(maxsize=4))
+    monkeypatch.setattr(factory.cache_config, "ttl", 60)
+
+    with open(catalog_json, "r") as f:
+        collections = json.loads(f.read())["collections"]
+
+    open_ended = copy.deepcopy(collections[0])
+    open_ended["extent"]["temporal"]["interval"] = [["2023-01-03T04:30:17Z", None]]
+    aggregation = copy.deepcopy(collections[0])
+    aggregation["renders"]["visual"]["aggregation"] = {
+        "name": "datetime_frequency",
+        "params": {"precision": {"days": 1}},
+    }
+    client.open.return_value.get_aggregation.return_value = [
+        {"key": "2023-01-03T00:00:00.000Z", "frequency": 1}
+    ]
+
+    url = "https://something.stac"
+    headers = {"x-test": "layers-dynamic-times"}
+    etags = factory._collections_etags(get_stac_api_io(headers))
+    etags[f"{url}/collections"] = '"v1"'
+    key = hashkey(url, frozenset(headers.items()))
+
+    for collection in [open_ended, aggregation]:
+        factory._layers_cache.clear()
+        client.open.return_value.get_collections.return_value = [
+            pystac.Collection.from_dict(collection)
+        ]
+        layers = get_layer_from_collections(url, headers)
+        assert layers
+        assert factory._layers_cache[key][1] is None
+
+        # Expired entries are rebuilt without revalidation
+        factory._layers_cache[key] = (time.monotonic() - 1, None, layers)
+        assert get_layer_from_collections(url, headers) is not layers
+        stac_api_get.assert_not_called()
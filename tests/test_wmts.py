@@ -7,8 +7,11 @@ from urllib.parse import parse_qs
 
 import pystac
 import rasterio
+from cachetools import LRUCache, TTLCache
 from owslib.wmts import WebMapTileService
 
+from titiler.core.utils import render_image
+
 item_json = os.path.join(
     os.path.dirname(__file__), "fixtures", "46_033111301201_1040010082988200.json"
 )
@@ -86,9 +89,21 @@ def test_wmts_getcapabilities(client, app):
         },
     )
     assert response.status_code == 200
+    assert response.headers["ETag"]
     wmts = WebMapTileService(url="/wmts", xml=response.text.encode())
     layers = list(wmts.contents)
     assert len(layers) == 4
+
+    response_304 = app.get(
+        "/wmts",
+        params={
+            "service": "WMTS",
+            "version": "1.0.0",
+            "request": "getcapabilities",
+        },
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response_304.status_code == 304
     assert "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual" in layers
     assert "MAXAR_BayofBengal_Cyclone_Mocha_May_23_color" in layers
     assert "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visualr" in layers
@@ -111,6 +126,30 @@ def test_wmts_getcapabilities(client, app):
     assert len(times) == 6
 
 
+@patch("titiler.stacapi.factory.get_layer_from_collections")
+def test_wmts_getcapabilities_cache(get_layers, app, monkeypatch):
+    """GetCapabilities documents are not shared between request URLs."""
+    from titiler.stacapi.main import wmts
+
+    monkeypatch.setattr(wmts, "_capabilities", TTLCache(maxsize=4, ttl=60))
+    get_layers.return_value = {}
+
+    params = {"service": "WMTS", "version": "1.0.0", "request": "getcapabilities"}
+    response = app.get("/wmts", params={**params, "access_token": "secret"})
+    assert response.status_code == 200
+    assert "secret" in response.text
+
+    response_other = app.get("/wmts", params=params)
+    assert response_other.status_code == 200
+    assert "secret" not in response_other.text
+    assert response_other.headers["ETag"] != response.headers["ETag"]
+
+    # same request, served from the cache
+    response_cached = app.get("/wmts", params={**params, "access_token": "secret"})
+    assert response_cached.text == response.text
+    assert len(wmts._capabilities) == 2
+
+
 @patch("rio_tiler.io.rasterio.rasterio")
 @patch("titiler.stacapi.factory.STACAPIBackend.get_assets")
 @patch("titiler.stacapi.factory.Client")
@@ -293,6 +332,77 @@ def test_wmts_gettile(client, get_assets, rio, app):
     assert response.status_code == 200
 
 
+@patch("rio_tiler.io.rasterio.rasterio")
+@patch("titiler.stacapi.factory.STACAPIBackend.get_assets")
+@patch("titiler.stacapi.factory.Client")
+def test_wmts_gettile_get_collection(client, get_assets, rio, app, monkeypatch):
+    """GetTile only fetches the layer's Collection."""
+    from titiler.stacapi import factory
+
+    monkeypatch.setattr(factory, "_layers_cache", LRUCache(maxsize=0))
+    rio.open = mock_rasterio_open
+
+    with open(catalog_json, "r") as f:
+        collections = {c["id"]: c for c in json.loads(f.read())["collections"]}
+
+    def get_collection(collection_id):
+        if collection_id not in collections:
+            raise KeyError(f"Collection {collection_id} not found on catalog")
+
+        return pystac.Collection.from_dict(collections[collection_id])
+
+    client.open.return_value.get_collection.side_effect = get_collection
+
+    with open(item_json, "r") as f:
+        get_assets.return_value = [json.loads(f.read())]
+
+    params = {
+        "service": "WMTS",
+        "version": "1.0.0",
+        "request": "gettile",
+        "layer": "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual",
+        "style": "default",
+        "format": "image/png",
+        "tilematrixset": "WebMercatorQuad",
+        "tilematrix": 14,
+        "tilerow": 7188,
+        "tilecol": 12375,
+        "TIME": "2023-01-05",
+    }
+    response = app.get("/wmts", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    client.open.return_value.get_collections.assert_not_called()
+
+    # Unknown collection, fallback to the Collections list
+    client.open.return_value.get_collections.return_value = [
+        pystac.Collection.from_dict(c) for c in collections.values()
+    ]
+    response = app.get("/wmts", params={**params, "layer": "collection_visual"})
+    assert response.status_code == 400
+    assert "Invalid 'LAYER' parameter" in response.json()["detail"]
+
+    # Only a few collection ids are tried for a layer id
+    get_collection = client.open.return_value.get_collection
+    get_collection.reset_mock()
+    response = app.get("/wmts", params={**params, "layer": "_".join("a" * 200)})
+    assert response.status_code == 400
+    assert get_collection.call_count == factory.MAX_LAYER_ID_SPLITS
+
+    # The cached Layers list is used first
+    monkeypatch.setattr(factory, "_layers_cache", LRUCache(maxsize=4))
+    monkeypatch.setattr(factory.cache_config, "ttl", 60)
+    response = app.get("/wmts", params={**params, "layer": "collection_color"})
+    assert response.status_code == 400
+
+    get_collection.reset_mock()
+    client.open.return_value.get_collections.reset_mock()
+    response = app.get("/wmts", params={**params, "layer": "collection_visualr"})
+    assert response.status_code == 400
+    get_collection.assert_not_called()
+    client.open.return_value.get_collections.assert_not_called()
+
+
 @patch("rio_tiler.io.rasterio.rasterio")
 @patch("titiler.stacapi.factory.STACAPIBackend.get_assets")
 @patch("titiler.stacapi.factory.Client")
@@ -562,3 +672,145 @@ def test_wmts_gettile_REST(client, get_assets, rio, app):
         },
     )
     assert response.headers["content-type"] == "image/png"
+
+
+@patch("titiler.stacapi.factory.render_image", wraps=render_image)
+@patch("rio_tiler.io.rasterio.rasterio")
+@patch("titiler.stacapi.factory.STACAPIBackend.get_assets")
+@patch("titiler.stacapi.factory.Client")
+def test_wmts_gettile_cache(client, get_assets, rio, render, app, monkeypatch):
+    """Rendered tiles are cached per request parameters."""
+    from titiler.stacapi.main import wmts
+
+    monkeypatch.setattr(wmts, "_tiles", TTLCache(maxsize=16, ttl=60))
+    rio.open = mock_rasterio_open
+
+    with open(catalog_json, "r") as f:
+        collections = [
+            pystac.Collection.from_dict(c) for c in json.loads(f.read())["collections"]
+        ]
+        client.open.return_value.get_collections.return_value = collections
+
+    with open(item_json, "r") as f:
+        get_assets.return_value = [json.loads(f.read())]
+
+    params = {
+        "SERVICE": "WMTS",
+        "VERSION": "1.0.0",
+        "REQUEST": "getTile",
+        "LAYER": "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual",
+        "STYLE": "default",
+        "FORMAT": "image/png",
+        "TILEMATRIXSET": "WebMercatorQuad",
+        "TILEMATRIX": 14,
+        "TILEROW": 7188,
+        "TILECOL": 12375,
+        "TIME": "2023-01-05",
+    }
+    response = app.get("/wmts", params=params)
+    assert response.status_code == 200
+    assert get_assets.call_count == 1
+    assert render.call_count == 1
+
+    # same request, served from the cache
+    response_cached = app.get("/wmts", params=params)
+    assert response_cached.status_code == 200
+    assert response_cached.headers["content-type"] == "image/png"
+    assert response_cached.content == response.content
+    assert get_assets.call_count == 1
+    assert render.call_count == 1
+
+    # `Cache-Control: no-cache` bypasses the cache
+    response = app.get("/wmts", params=params, headers={"Cache-Control": "no-cache"})
+    assert response.status_code == 200
+    assert get_assets.call_count == 2
+    assert render.call_count == 2
+
+    # KVP only uses the last TIME value, so the order matters
+    kvp = [(k, v) for k, v in params.items() if k != "TIME"]
+    for times in (["2023-01-06", "2023-01-07"], ["2023-01-07", "2023-01-06"]):
+        response = app.get("/wmts", params=kvp + [("TIME", t) for t in times])
+        assert response.status_code == 200
+
+    assert get_assets.call_count == 4
+    datetimes = [
+        c.kwargs["search_query"]["datetime"] for c in get_assets.call_args_list[2:]
+    ]
+    assert datetimes[0].startswith("2023-01-07")
+    assert datetimes[1].startswith("2023-01-06")
+
+    # REST parameters are order and case sensitive
+    wmts._tiles.clear()
+    url = "/layers/MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual/default/2023-01-05/WebMercatorQuad/14/12375/7188.png"
+    rescale = ["0,100", "0,200", "0,255"]
+    queries = [
+        [("assets", "visual"), *(("rescale", r) for r in rescale)],
+        [("assets", "visual"), *(("rescale", r) for r in reversed(rescale))],
+        [("assets", "visual"), ("asset_bidx", "visual|1,1,2")],
+        [("assets", "visual"), ("asset_bidx", "visual|1,2")],
+        [("assets", "visual"), ("rescale", "0,1")],
+        [("assets", "visual"), ("Rescale", "0,1")],
+    ]
+    for query in queries:
+        response = app.get(url, params=query)
+        assert response.status_code == 200
+
+    assert len(wmts._tiles) == len(queries)
+    assert get_assets.call_count == 4 + len(queries)
+
+
+@patch("rio_tiler.io.rasterio.rasterio")
+@patch("titiler.stacapi.factory.STACAPIBackend.get_assets")
+@patch("titiler.stacapi.factory.Client")
+def test_wmts_getfeatureinfo_cache(client, get_assets, rio, app, monkeypatch):
+    """GetFeatureInfo requests on the same tile only read it once."""
+    from titiler.stacapi.main import wmts
+
+    rio.open = mock_rasterio_open
+
+    with open(catalog_json, "r") as f:
+        collections = [
+            pystac.Collection.from_dict(c) for c in json.loads(f.read())["collections"]
+        ]
+        client.open.return_value.get_collections.return_value = collections
+
+    with open(item_json, "r") as f:
+        get_assets.return_value = [json.loads(f.read())]
+
+    params = {
+        "service": "WMTS",
+        "version": "1.0.0",
+        "request": "getfeatureinfo",
+        "layer": "MAXAR_BayofBengal_Cyclone_Mocha_May_23_visual",
+        "style": "default",
+        "format": "image/png",
+        "tilematrixset": "WebMercatorQuad",
+        "tilematrix": 14,
+        "tilerow": 7188,
+        "tilecol": 12375,
+        "TIME": "2023-01-05",
+        "infoformat": "application/geo+json",
+    }
+    pixels = [(170, 177), (99, 190)]
+
+    # Values read without cache
+    monkeypatch.setattr(wmts, "_feature_info_images", TTLCache(maxsize=0, ttl=60))
+    expected = []
+    for i, j in pixels:
+        response = app.get("/wmts", params={**params, "i": i, "j": j})
+        assert response.status_code == 200
+        expected.append(response.json())
+
+    assert get_assets.call_count == 2
+    assert expected[0]["properties"]["values"] == [118, 106, 101]
+    assert expected[1]["properties"]["values"] == [65, 64, 62]
+
+    monkeypatch.setattr(wmts, "_feature_info_images", TTLCache(maxsize=4, ttl=60))
+    get_assets.reset_mock()
+    for (i, j), feature in zip(pixels, expected):
+        response = app.get("/wmts", params={**params, "i": i, "j": j})
+        assert response.status_code == 200
+        assert response.json() == feature
+
+    assert get_assets.call_count == 1
+    assert len(wmts._feature_info_images) == 1
@@ -1,9 +1,10 @@
 """titiler-stacapi custom Mosaic Backend and Custom STACReader."""
 
-import json
+from functools import partial
 from typing import Any, Dict, List, Optional, Tuple, Type
 
 import attr
+import orjson
 import rasterio
 from cachetools import TTLCache, cached
 from cachetools.keys import hashkey
@@ -14,7 +15,6 @@ from geojson_pydantic import Point, Polygon
 from geojson_pydantic.geometries import Geometry
 from morecantile import Tile, TileMatrixSet
 from pystac_client import ItemSearch
-from pystac_client.stac_api_io import StacApiIO
 from rasterio.crs import CRS
 from rasterio.warp import transform, transform_bounds
 from rio_tiler.constants import WEB_MERCATOR_TMS, WGS84_CRS
@@ -24,16 +24,24 @@ from rio_tiler.io.base import BaseReader, MultiBaseReader
 from rio_tiler.models import ImageData
 from rio_tiler.mosaic import mosaic_reader
 from rio_tiler.types import AssetInfo, BBox
-from urllib3 import Retry
 
-from titiler.stacapi.settings import CacheSettings, RetrySettings, STACSettings
-from titiler.stacapi.utils import Timer
+from titiler.stacapi.settings import CacheSettings, STACSettings
+from titiler.stacapi.utils import Timer, get_stac_api_io
 
 cache_config = CacheSettings()
-retry_config = RetrySettings()
 stac_config = STACSettings()
 
 
+def _asset_href(asset_info: Dict) -> str:
+    """Return asset's href."""
+    return asset_info["href"]
+
+
+def _alternate_asset_href(asset_info: Dict) -> str:
+    """Return asset's alternate href (defined by `TITILER_STACAPI_ALTERNATE_URL`)."""
+    return asset_info["alternate"][stac_config.alternate_url]["href"]
+
+
 @attr.s
 class CustomSTACReader(MultiBaseReader):
     """Simplified STAC Reader.
@@ -62,6 +70,11 @@ class CustomSTACReader(MultiBaseReader):
 
     ctx: Any = attr.ib(default=rasterio.Env)
 
+    # `alternate_url` is set at startup so we select the href resolver once
+    _resolve_href = staticmethod(
+        _alternate_asset_href if stac_config.alternate_url else _asset_href
+    )
+
     def __attrs_post_init__(self) -> None:
         """Set reader spatial infos and list of valid assets."""
         self.bounds = self.input["bbox"]
@@ -93,14 +106,10 @@ class CustomSTACReader(MultiBaseReader):
 
         asset_info = self.input["assets"][asset]
 
-        url = asset_info["href"]
-        if alternate := stac_config.alternate_url:
-            url = asset_info["alternate"][alternate]["href"]
-
-        info = AssetInfo(url=url, env={})
+        info = AssetInfo(url=self._resolve_href(asset_info))
 
         if header_size := asset_info.get("file:header_size"):
-            info["env"]["GDAL_INGESTED_BYTES_AT_OPEN"] = header_size
+            info["env"] = {"GDAL_INGESTED_BYTES_AT_OPEN": header_size}
 
         if bands := asset_info.get("raster:bands"):
             stats = [
@@ -114,6 +123,21 @@ class CustomSTACReader(MultiBaseReader):
         return info
 
 
+def _read_asset_tile(
+    item: Dict[str, Any],
+    x: int,
+    y: int,
+    z: int,
+    reader: Type[CustomSTACReader] = CustomSTACReader,
+    tms: TileMatrixSet = WEB_MERCATOR_TMS,
+    reader_options: Optional[Dict] = None,
+    **kwargs: Any,
+) -> ImageData:
+    """Read a tile from a STAC Item (used by `mosaic_reader`)."""
+    with reader(item, tms=tms, **(reader_options or {})) as src_dst:
+        return src_dst.tile(x, y, z, **kwargs)
+
+
 @attr.s
 class STACAPIBackend(BaseBackend):
     """STACAPI Mosaic Backend."""
@@ -221,11 +245,11 @@ class STACAPIBackend(BaseBackend):
 
     @cached(  # type: ignore
         TTLCache(maxsize=cache_config.maxsize, ttl=cache_config.ttl),
-        key=lambda self, geom, search_query, **kwargs: hashkey(
+        key=lambda self, geom, search_query=None, **kwargs: hashkey(
             self.url,
-            str(geom),
-            json.dumps(search_query),
-            json.dumps(self.headers),
+            geom.model_dump_json(exclude_none=True),
+            orjson.dumps(search_query, option=orjson.OPT_SORT_KEYS),
+            frozenset((self.headers or {}).items()),
             **kwargs,
         ),
     )
@@ -239,14 +263,6 @@ class STACAPIBackend(BaseBackend):
         search_query = search_query or {}
         fields = fields or ["assets", "id", "bbox", "collection"]
 
-        stac_api_io = StacApiIO(
-            max_retries=Retry(
-                total=retry_config.retry,
-                backoff_factor=retry_config.retry_factor,
-            ),
-            headers=self.headers,
-        )
-
         params = {
             **search_query,
             "intersects": geom.model_dump_json(exclude_none=True),
@@ -256,7 +272,7 @@ class STACAPIBackend(BaseBackend):
 
         results = ItemSearch(
             f"{self.url}/search",
-            stac_io=stac_api_io,
+            stac_io=get_stac_api_io(self.headers),
             **params,
         )
         return list(results.items_as_dicts())
@@ -291,11 +307,12 @@ class STACAPIBackend(BaseBackend):
                 f"No assets found for tile {tile_z}-{tile_x}-{tile_y}"
             )
 
-        def _reader(
-            item: Dict[str, Any], x: int, y: int, z: int, **kwargs: Any
-        ) -> ImageData:
-            with self.reader(item, tms=self.tms, **self.reader_options) as src_dst:
-                return src_dst.tile(x, y, z, **kwargs)
+        _reader = partial(
+            _read_asset_tile,
+            reader=self.reader,
+            tms=self.tms,
+            reader_options=self.reader_options,
+        )
 
         with Timer() as t:
             img, used_assets = mosaic_reader(
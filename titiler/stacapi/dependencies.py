@@ -1,28 +1,53 @@
 """titiler-stacapi dependencies."""
 
-import json
-from typing import Dict, List, Literal, Optional, TypedDict, get_args
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from typing import (
+    Any,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    get_args,
+)
+from urllib.parse import quote
 
 import pystac
-from cachetools import TTLCache, cached
 from cachetools.keys import hashkey
-from fastapi import Depends, HTTPException, Path, Query
+from fastapi import HTTPException, Path, Query
 from pystac_client import ItemSearch
-from pystac_client.stac_api_io import StacApiIO
+from pystac_client.exceptions import APIError
 from starlette.requests import Request
 from typing_extensions import Annotated
-from urllib3 import Retry
 
 from titiler.stacapi.enums import MediaType
-from titiler.stacapi.settings import CacheSettings, RetrySettings
+from titiler.stacapi.settings import CacheSettings
+from titiler.stacapi.utils import get_stac_api_io, stac_api_get
 
 ResponseType = Literal["json", "html"]
 
+# Media types supported by `OutputType` (in order of preference)
+_F_TO_MEDIATYPE = {v: MediaType.__members__[v] for v in get_args(ResponseType)}
+_DEFAULT_OUTPUT_MEDIATYPES = tuple(_F_TO_MEDIATYPE.values())
+
+# Match `{name}` and optional `q={quality}` parameter for each Accept entry
+# (the header must be prefixed with `,` before matching)
+_ACCEPT_RE = re.compile(r",\s*([^\s;,]+)(?:[^,]*?;\s*q=([^\s;,]*))?")
+
 cache_config = CacheSettings()
-retry_config = RetrySettings()
 
 
-def accept_media_type(accept: str, mediatypes: List[MediaType]) -> Optional[MediaType]:
+def accept_media_type(
+    accept: str, mediatypes: Sequence[MediaType]
+) -> Optional[MediaType]:
     """Return MediaType based on accept header and available mediatype.
 
     Links:
@@ -30,45 +55,47 @@ def accept_media_type(accept: str, mediatypes: List[MediaType]) -> Optional[Medi
     - https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Accept
 
     """
-    accept_values = {}
-    for m in accept.replace(" ", "").split(","):
-        values = m.split(";")
-        if len(values) == 1:
-            name = values[0]
-            quality = 1.0
-        else:
-            name = values[0]
-            groups = dict([param.split("=") for param in values[1:]])  # type: ignore
-            try:
-                q = groups.get("q")
-                quality = float(q) if q else 1.0
-            except ValueError:
-                quality = 0
+    # No Accept header (or `*/*`) means any media type is accepted
+    stripped = accept.strip()
+    if not stripped or stripped == "*/*":
+        return mediatypes[0] if mediatypes else None
+
+    accept_values: List[Tuple[float, str]] = []
+    for match in _ACCEPT_RE.finditer("," + accept):
+        name, q = match.groups()
+        try:
+            quality = float(q) if q else 1.0
+        except ValueError:
+            quality = 0
 
         # if quality is 0 we ignore encoding
         if quality:
-            accept_values[name] = quality
+            accept_values.append((quality, name))
 
-    # Create Preference matrix
-    media_preference = {
-        v: [n for (n, q) in accept_values.items() if q == v]
-        for v in sorted(set(accept_values.values()), reverse=True)
-    }
+    # Sort by quality (stable, so header order is kept for equal quality)
+    accept_values.sort(key=itemgetter(0), reverse=True)
 
-    # Loop through available compression and encoding preference
-    for _, pref in media_preference.items():
+    # For each quality level, return the first available media type
+    for _, values in groupby(accept_values, key=itemgetter(0)):
+        pref = {name for _, name in values}
         for media in mediatypes:
             if media.value in pref:
                 return media
 
     # If no specified encoding is supported but "*" is accepted,
     # take one of the available compressions.
-    if "*" in accept_values and mediatypes:
+    if mediatypes and any(name == "*" for _, name in accept_values):
         return mediatypes[0]
 
     return None
 
 
+@lru_cache(maxsize=256)
+def _negotiate(accept: str) -> Optional[MediaType]:
+    """Return OutputType's MediaType for an Accept header (cached)."""
+    return accept_media_type(accept, _DEFAULT_OUTPUT_MEDIATYPES)
+
+
 def OutputType(
     request: Request,
     f: Annotated[
@@ -80,75 +107,196 @@ def OutputType(
 ) -> Optional[MediaType]:
     """Output MediaType: json or html."""
     if f:
-        return MediaType[f]
+        return _F_TO_MEDIATYPE[f]
 
-    accepted_media = [MediaType[v] for v in get_args(ResponseType)]
-    return accept_media_type(request.headers.get("accept", ""), accepted_media)
+    return _negotiate(request.headers.get("accept", ""))
 
 
-class APIParams(TypedDict, total=False):
+class APIParams(NamedTuple):
     """STAC API Parameters."""
 
     api_url: str
-    headers: Optional[Dict]
+    headers: Optional[Dict] = None
 
 
 def STACApiParams(
     request: Request,
 ) -> APIParams:
     """Return STAC API Parameters."""
+    if api_params := getattr(request.app.state, "api_params", None):
+        return api_params
+
     return APIParams(
         api_url=request.app.state.stac_url,
     )
 
 
-@cached(  # type: ignore
-    TTLCache(maxsize=cache_config.maxsize, ttl=cache_config.ttl),
-    key=lambda url, collection_id, item_id, headers, **kwargs: hashkey(
-        url, collection_id, item_id, json.dumps(headers)
-    ),
-)
+# Item cache entries are `(expires_at, etag, item)` tuples. Hits only use atomic
+# OrderedDict operations so they don't need to take the lock. Expired entries
+# are kept so their ETag can be used to revalidate the Item.
+_ItemCacheEntry = Tuple[float, Optional[str], pystac.Item]
+_item_cache: "OrderedDict[Any, _ItemCacheEntry]" = OrderedDict()
+_item_cache_lock = threading.Lock()
+_item_requests: Dict[Any, threading.Lock] = {}
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _get_cached_item(key: Any) -> Optional[pystac.Item]:
+    """Return a non-expired Item from the cache."""
+    entry = _item_cache.get(key)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+
+    try:
+        _item_cache.move_to_end(key)
+    except KeyError:  # evicted by another thread
+        pass
+
+    return entry[2]
+
+
+def _set_cached_item(key: Any, entry: _ItemCacheEntry) -> None:
+    """Add an Item to the cache, evicting the least recently used entries."""
+    if cache_config.maxsize <= 0 or cache_config.ttl <= 0:
+        return
+
+    with _item_cache_lock:
+        _item_cache[key] = entry
+        _item_cache.move_to_end(key)
+        while len(_item_cache) > cache_config.maxsize:
+            _item_cache.popitem(last=False)
+
+
+def _cache_ttl(cache_control: Optional[str]) -> float:
+    """Item TTL, capped by the STAC API `Cache-Control` response header."""
+    if not cache_control:
+        return cache_config.ttl
+
+    # Always revalidate the Item
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+
+    if match := _MAX_AGE_RE.search(cache_control):
+        return min(cache_config.ttl, int(match.group(1)))
+
+    return cache_config.ttl
+
+
 def get_stac_item(
     url: str,
     collection_id: str,
     item_id: str,
     headers: Optional[Dict] = None,
 ) -> pystac.Item:
-    """Get STAC Item from STAC API."""
-    stac_api_io = StacApiIO(
-        max_retries=Retry(
-            total=retry_config.retry,
-            backoff_factor=retry_config.retry_factor,
-        ),
-        headers=headers,
+    """Get STAC Item from STAC API.
+
+    Concurrent calls for the same Item wait for the first one to fetch it
+    instead of all sending requests to the STAC API.
+
+    """
+    key = hashkey(url, collection_id, item_id, frozenset((headers or {}).items()))
+
+    if (item := _get_cached_item(key)) is not None:
+        return item
+
+    # Nothing can be shared between the calls
+    if cache_config.maxsize <= 0 or cache_config.ttl <= 0:
+        return _fetch_stac_item(url, collection_id, item_id, headers=headers)[2]
+
+    # Expired entry, used to find out if the Item was fetched while we waited
+    # for the lock (e.g. with a `0` TTL when the STAC API sends `no-cache`)
+    expired = _item_cache.get(key)
+
+    with _item_cache_lock:
+        request_lock = _item_requests.setdefault(key, threading.Lock())
+
+    try:
+        with request_lock:
+            entry = _item_cache.get(key)
+            if entry is None or (entry is expired and entry[0] <= time.monotonic()):
+                entry = _fetch_stac_item(
+                    url, collection_id, item_id, headers=headers, cached=entry
+                )
+                _set_cached_item(key, entry)
+
+    finally:
+        with _item_cache_lock:
+            _item_requests.pop(key, None)
+
+    return entry[2]
+
+
+def _fetch_stac_item(
+    url: str,
+    collection_id: str,
+    item_id: str,
+    headers: Optional[Dict] = None,
+    cached: Optional[_ItemCacheEntry] = None,
+) -> _ItemCacheEntry:
+    """Fetch STAC Item from STAC API.
+
+    When an expired cache entry with an ETag is passed, the Item is revalidated
+    using `If-None-Match` and re-used if the STAC API returns `304`.
+
+    """
+    stac_api_io = get_stac_api_io(headers)
+
+    # Direct access using the OGC Features `/collections/{cid}/items/{iid}` endpoint
+    # (ids are path-decoded, so they need to be quoted again)
+    resp = stac_api_get(
+        stac_api_io,
+        f"{url}/collections/{quote(collection_id, safe='')}/items/{quote(item_id, safe='')}",
+        headers={"If-None-Match": cached[1]} if cached and cached[1] else None,
     )
+    ttl = _cache_ttl(resp.headers.get("Cache-Control"))
+
+    if resp.status_code == 304 and cached:
+        return (time.monotonic() + ttl, cached[1], cached[2])
+
+    if resp.status_code == 200:
+        item = pystac.Item.from_dict(
+            stac_api_io.json_loads(resp.text), preserve_dict=False
+        )
+        return (time.monotonic() + ttl, resp.headers.get("ETag"), item)
+
+    if resp.status_code not in (404, 405):
+        raise APIError.from_response(resp)
+
+    # Fallback to `/search` (e.g. API without the OGC Features endpoints)
     results = ItemSearch(
-        f"{url}/search", stac_io=stac_api_io, collections=[collection_id], ids=[item_id]
+        f"{url}/search",
+        stac_io=stac_api_io,
+        collections=[collection_id],
+        ids=[item_id],
+        limit=1,
+        max_items=1,
     )
-    items = list(results.items())
-    if not items:
+    found: Optional[pystac.Item] = next(results.items(), None)
+    if found is None:
         raise HTTPException(
             404,
             f"Could not find Item {item_id} in {collection_id} collection.",
         )
 
-    return items[0]
+    return (time.monotonic() + cache_config.ttl, None, found)
 
 
 def ItemIdParams(
+    request: Request,
     collection_id: Annotated[
         str,
         Path(description="STAC Collection Identifier"),
     ],
     item_id: Annotated[str, Path(description="STAC Item Identifier")],
-    api_params=Depends(STACApiParams),
 ) -> pystac.Item:
     """STAC Item dependency for the MultiBaseTilerFactory."""
+    api_params = STACApiParams(request)
     return get_stac_item(
-        api_params["api_url"],
+        api_params.api_url,
         collection_id,
         item_id,
-        headers=api_params.get("headers", {}),
+        headers=api_params.headers,
     )
 
 
@@ -190,10 +338,24 @@ def STACSearchParams(
     ] = None,
 ) -> Dict:
     """Dependency to construct STAC API Search Query."""
+    bounds = None
+    if bbox:
+        try:
+            # maxsplit=4 so we don't parse more values than needed
+            bounds = [float(v) for v in bbox.split(",", 4)]
+        except ValueError:
+            bounds = []
+
+        if len(bounds) != 4:
+            raise HTTPException(
+                400,
+                f"Invalid 'bbox' parameter: {bbox}. Should be 4 comma-separated numbers.",
+            )
+
     return {
         "collections": [collection_id],
         "ids": ids.split(",") if ids else None,
-        "bbox": list(map(float, bbox.split(","))) if bbox else None,
+        "bbox": bounds,
         "datetime": datetime,
         # "sortby": sortby,
         # "filter": query,
@@ -1,36 +1,43 @@
 """Custom MosaicTiler Factory for TiTiler-STACAPI Mosaic Backend."""
 
 import datetime as python_datetime
+import hashlib
 import json
 import os
-from copy import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Callable, Dict, List, Literal, Optional, Type
+from functools import cached_property, lru_cache, partial
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Type, cast
 from urllib.parse import urlencode
 
 import jinja2
+import orjson
 import rasterio
-from cachetools import TTLCache, cached
+from cachetools import LRUCache, TTLCache, cached
 from cachetools.keys import hashkey
 from cogeo_mosaic.backends import BaseBackend
 from fastapi import Depends, HTTPException, Path, Query
+from fastapi.dependencies.models import Dependant
 from fastapi.dependencies.utils import get_dependant, request_params_to_args
+from morecantile import TileMatrixSet
 from morecantile import tms as morecantile_tms
 from morecantile.defaults import TileMatrixSets
 from pydantic import conint
+from pyproj import Transformer
+from pystac import Collection
+from pystac_client.exceptions import APIError
 from pystac_client.stac_api_io import StacApiIO
-from rasterio.transform import xy as rowcol_to_coords
-from rasterio.warp import transform as transform_points
-from rio_tiler.constants import MAX_THREADS
 from rio_tiler.models import ImageData
 from rio_tiler.mosaic.methods.base import MosaicMethodBase
 from starlette.requests import Request
 from starlette.responses import HTMLResponse, Response
 from starlette.routing import compile_path, replace_params
 from starlette.templating import Jinja2Templates
-from typing_extensions import Annotated
-from urllib3 import Retry
+from typing_extensions import Annotated, Final
 
 from titiler.core.dependencies import (
     AssetsBidxExprParams,
@@ -41,25 +48,34 @@ from titiler.core.dependencies import (
 from titiler.core.factory import BaseTilerFactory, img_endpoint_params
 from titiler.core.models.mapbox import TileJSON
 from titiler.core.resources.enums import ImageType, MediaType, OptionalHeader
-from titiler.core.resources.responses import GeoJSONResponse, XMLResponse
+from titiler.core.resources.responses import XMLResponse
 from titiler.core.utils import render_image
 from titiler.mosaic.factory import PixelSelectionParams
 from titiler.stacapi.backend import STACAPIBackend
 from titiler.stacapi.dependencies import APIParams, STACApiParams, STACSearchParams
 from titiler.stacapi.models import FeatureInfo, LayerDict
 from titiler.stacapi.pystac import Client
-from titiler.stacapi.settings import CacheSettings, RetrySettings
-from titiler.stacapi.utils import _tms_limits
+from titiler.stacapi.settings import ApiSettings, CacheSettings
+from titiler.stacapi.utils import (
+    MOSAIC_THREADS,
+    DateList,
+    DateRange,
+    JinjaBytecodeCache,
+    _tms_limits,
+    get_stac_api_io,
+    stac_api_get,
+)
 
+api_config = ApiSettings()
 cache_config = CacheSettings()
-retry_config = RetrySettings()
 
-MOSAIC_THREADS = int(os.getenv("MOSAIC_CONCURRENCY", MAX_THREADS))
-MOSAIC_STRICT_ZOOM = str(os.getenv("MOSAIC_STRICT_ZOOM", False)).lower() in [
-    "true",
-    "yes",
-]
+MOSAIC_STRICT_ZOOM: Final[bool] = str(
+    os.getenv("MOSAIC_STRICT_ZOOM", False)
+).lower() in ("true", "yes")
 
+# Templates are package files, so we don't need to check if they changed on each
+# request. Compiled templates can also be stored on disk (`jinja_cache_dir`)
+# to avoid compiling them again on each cold start.
 jinja2_env = jinja2.Environment(
     loader=jinja2.ChoiceLoader(
         [
@@ -67,10 +83,20 @@ jinja2_env = jinja2.Environment(
             jinja2.PackageLoader("titiler.core", "templates"),
         ]
     ),
+    auto_reload=False,
+    bytecode_cache=JinjaBytecodeCache(api_config.jinja_cache_dir)
+    if api_config.jinja_cache_dir
+    else None,
 )
 DEFAULT_TEMPLATES = Jinja2Templates(env=jinja2_env)
 
 
+@lru_cache(maxsize=None)
+def _get_dependant(dependency: Callable) -> Dependant:
+    """Get (and cache) the FastAPI Dependant of a dependency callable."""
+    return get_dependant(path="", call=dependency)
+
+
 def get_dependency_params(*, dependency: Callable, query_params: Dict) -> Any:
     """Check QueryParams for Query dependency.
 
@@ -81,7 +107,7 @@ def get_dependency_params(*, dependency: Callable, query_params: Dict) -> Any:
     Important: We assume the `callable` in not a co-routine
 
     """
-    dep = get_dependant(path="", call=dependency)
+    dep = _get_dependant(dependency)
     if dep.query_params:
         # call the dependency with the query-parameters values
         query_values, _ = request_params_to_args(dep.query_params, query_params)
@@ -213,10 +239,10 @@ class MosaicTilerFactory(BaseTilerFactory):
             scale = scale or 1
 
             tms = self.supported_tms.get(tileMatrixSetId)
-            with rasterio.Env(**env):
+            with rasterio.Env(**env) if env else nullcontext():
                 with self.reader(
-                    url=api_params["api_url"],
-                    headers=api_params.get("headers", {}),
+                    url=api_params.api_url,
+                    headers=api_params.headers,
                     tms=tms,
                     reader_options={**reader_params},
                     **backend_params,
@@ -538,6 +564,51 @@ class MosaicTilerFactory(BaseTilerFactory):
             )
 
 
+# List of required parameters for each WMTS request (styles and crs are excluded)
+WMTS_REQUIRED_PARAMS = {
+    "gettile": frozenset(
+        {
+            "service",
+            "request",
+            "version",
+            "layer",
+            "style",
+            "format",
+            "tilematrixset",
+            "tilematrix",
+            "tilerow",
+            "tilecol",
+        }
+    ),
+    "getfeatureinfo": frozenset(
+        {
+            "service",
+            "request",
+            "version",
+            "layer",
+            "style",
+            "tilematrixset",
+            "tilematrix",
+            "tilerow",
+            "tilecol",
+            "i",
+            "j",
+            "infoformat",
+        }
+    ),
+}
+
+
+class ORJSONGeoJSONResponse(Response):
+    """GeoJSON response encoded with orjson."""
+
+    media_type = "application/geo+json"
+
+    def render(self, content: Any) -> bytes:
+        """Encode content with orjson."""
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
 class WMTSMediaType(str, Enum):
     """Responses Media types for WMTS"""
 
@@ -549,172 +620,372 @@ class WMTSMediaType(str, Enum):
     webp = "image/webp"
 
 
-@cached(  # type: ignore
-    TTLCache(maxsize=cache_config.maxsize, ttl=cache_config.ttl),
-    key=lambda url, headers, supported_tms: hashkey(url, json.dumps(headers)),
-)
-def get_layer_from_collections(  # noqa: C901
+_transformers = threading.local()
+
+
+def _wgs84_transformer(crs: str) -> Transformer:
+    """Get a Transformer from `crs` (WKT) to WGS84.
+
+    Transformers are cached per thread so they are never shared between threads.
+
+    """
+    cache: Dict[str, Transformer] = _transformers.__dict__.setdefault("cache", {})
+    if (transformer := cache.get(crs)) is None:
+        transformer = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+        cache[crs] = transformer
+
+    return transformer
+
+
+@lru_cache(maxsize=16)
+def _wmts_image_type(media_type: str) -> ImageType:
+    """Get ImageType from WMTS media type."""
+    return ImageType(WMTSMediaType(media_type).name)
+
+
+def _get_collection_layers(  # noqa: C901
+    catalog: Client,
+    collection: Collection,
+    supported_tms: TileMatrixSets,
+) -> Dict[str, LayerDict]:
+    """Get Layers from a STAC Collection `renders`."""
+    spatial_extent = collection.extent.spatial
+    temporal_extent = collection.extent.temporal
+    bbox = spatial_extent.bboxes[0] if spatial_extent else [-180, -90, 180, 90]
+    supported_tms_ids = supported_tms.list()
+
+    # All the renders share the Collection's bbox
+    @lru_cache(maxsize=None)
+    def tms_limits(tms_id: str, zooms: Optional[Tuple[int, ...]] = None) -> List:
+        """Get TileMatrix limits for the Collection's bbox."""
+        return _tms_limits(supported_tms.get(tms_id), bbox, zooms=zooms)
+
+    layers: Dict[str, LayerDict] = {}
+    if "renders" in collection.extra_fields:
+        for name, render in collection.extra_fields["renders"].items():
+            # Don't modify the Collection, it can be used to build the layers again
+            render = render.copy()
+
+            tilematrixsets = render.pop("tilematrixsets", None)
+            output_format = render.pop("format", None)
+            aggregation = render.pop("aggregation", None)
+
+            _ = render.pop("minmax_zoom", None)  # Not Used
+            _ = render.pop("title", None)  # Not Used
+
+            # see https://github.com/developmentseed/eoAPI-vito/issues/9#issuecomment-2034025021
+            render_title = f"{collection.id}_{name}"
+            layer = {
+                "id": render_title,
+                "collection": collection.id,
+                "bbox": bbox,
+                "style": "default",
+                "render": render,
+            }
+            if output_format:
+                layer["format"] = output_format
+
+            # NB. The WMTS spec is contradictory re. the multiplicity
+            # relationships between Layer and TileMatrixSetLink, and
+            # TileMatrixSetLink and tileMatrixSet (URI).
+            # WMTS only support 1 set of limits for a TileMatrixSet
+            if tilematrixsets:
+                if len(tilematrixsets) == 1:
+                    layer["tilematrixsets"] = {
+                        tms_id: tms_limits(tms_id, tuple(zooms) if zooms else None)
+                        for tms_id, zooms in tilematrixsets.items()
+                    }
+                else:
+                    layer["tilematrixsets"] = {
+                        tms_id: None for tms_id, _ in tilematrixsets.items()
+                    }
+
+            else:
+                if len(supported_tms_ids) == 1:
+                    layer["tilematrixsets"] = {
+                        tms_id: tms_limits(tms_id) for tms_id in supported_tms_ids
+                    }
+                else:
+                    layer["tilematrixsets"] = {
+                        tms_id: None for tms_id in supported_tms_ids
+                    }
+
+            if (
+                "cube:dimensions" in collection.extra_fields
+                and "time" in collection.extra_fields["cube:dimensions"]
+            ):
+                # Values are in form of `%Y-%m-%dT%H:%M:%SZ`, we only keep the date
+                layer["time"] = DateList(
+                    t[:10]
+                    for t in collection.extra_fields["cube:dimensions"]["time"][
+                        "values"
+                    ]
+                )
+            elif aggregation and aggregation["name"] == "datetime_frequency":
+                datetime_aggregation = catalog.get_aggregation(
+                    collection_id=collection.id,
+                    aggregation="datetime_frequency",
+                    aggregation_params=aggregation["params"],
+                )
+                # Keys are in form of `%Y-%m-%dT%H:%M:%S.000Z`, we only keep the date
+                layer["time"] = DateList(
+                    t["key"][:10] for t in datetime_aggregation if t["frequency"] > 0
+                )
+            elif (intervals := temporal_extent.intervals) and (
+                start_date := intervals[0][0]
+            ):
+                end_date = (
+                    intervals[0][1]
+                    if intervals[0][1]
+                    else python_datetime.datetime.now(python_datetime.timezone.utc)
+                )
+
+                layer["time"] = DateRange(
+                    start_date.date(), (end_date - start_date).days + 1
+                )
+
+            render = layer["render"] or {}
+
+            # special encoding for rescale
+            # Per Specification, the rescale entry is a 2d array in form of `[[min, max], [min,max]]`
+            # We need to convert this to `['{min},{max}', '{min},{max}']` for titiler dependency
+            if rescale := render.pop("rescale", None):
+                render["rescale"] = [
+                    r if isinstance(r, str) else ",".join(map(str, r)) for r in rescale
+                ]
+
+            # special encoding for ColorMaps
+            # Per Specification, the colormap is a JSON object. TiTiler dependency expects a string encoded dict
+            if colormap := render.pop("colormap", None):
+                if not isinstance(colormap, str):
+                    colormap = json.dumps(colormap)
+
+                render["colormap"] = colormap
+
+            layer["query_string"] = urlencode(
+                [(k, v) for k, v in render.items() if v is not None],
+                doseq=True,
+            )
+
+            layers[render_title] = LayerDict(
+                id=layer["id"],
+                collection=layer["collection"],
+                bbox=layer["bbox"],
+                format=layer.get("format"),
+                style=layer["style"],
+                render=layer.get("render", {}),
+                tilematrixsets=layer["tilematrixsets"],
+                time=layer.get("time"),
+                query_string=layer["query_string"],
+            )
+
+    return layers
+
+
+# Number of collection ids tried for a layer id, i.e. render names with up to
+# 2 `_` (see `get_layer`)
+MAX_LAYER_ID_SPLITS = 3
+
+# Layers cache entries are `(expires_at, etag, layers)` tuples. Expired entries
+# are kept so their ETag can be used to revalidate the Layers.
+_layers_cache: LRUCache = LRUCache(maxsize=cache_config.maxsize)
+_layers_cache_lock = threading.Lock()
+
+
+def _collections_etags(stac_api_io: StacApiIO) -> Dict[str, Optional[str]]:
+    """Record the `ETag` of the `/collections` responses received by a StacApiIO."""
+    session = stac_api_io.session
+    with _layers_cache_lock:
+        # The hook is only registered once per session
+        if (etags := getattr(session, "_collections_etags", None)) is not None:
+            return etags
+
+        etags = {}
+
+        def record_etag(resp, *args, **kwargs):
+            href, _, query = resp.request.url.partition("?")
+            if resp.status_code == 200 and href.endswith("/collections"):
+                # We can't revalidate paginated collections with the first page ETag
+                etags[href] = None if query else resp.headers.get("ETag")
+
+        session.hooks["response"].append(record_etag)
+        session._collections_etags = etags  # type: ignore
+        return etags
+
+
+def _set_cached_layers(key: Any, entry: Tuple) -> None:
+    """Add Layers to the cache."""
+    with _layers_cache_lock:
+        try:
+            _layers_cache[key] = entry
+        except ValueError:  # value too large (e.g. cache disabled)
+            pass
+
+
+def get_layer_from_collections(
     url: str,
     headers: Optional[Dict] = None,
     supported_tms: Optional[TileMatrixSets] = None,
 ) -> Dict[str, LayerDict]:
-    """Get Layers from STAC Collections."""
-    supported_tms = supported_tms or morecantile_tms
+    """Get Layers from STAC Collections.
+
+    Layers are cached. When the cache entry expires and the STAC API returned an
+    `ETag` for `/collections`, the entry is revalidated using `If-None-Match`
+    instead of listing all the collections again.
+
+    """
+    key = hashkey(url, frozenset((headers or {}).items()))
+    with _layers_cache_lock:
+        entry = _layers_cache.get(key)
+
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[2]
+
+    stac_api_io = get_stac_api_io(headers)
+    etags = _collections_etags(stac_api_io)
+    collections_href = url.rstrip("/") + "/collections"
+
+    collections: Optional[List[Collection]] = None
+    if entry is not None and entry[1]:
+        resp = stac_api_get(
+            stac_api_io, collections_href, headers={"If-None-Match": entry[1]}
+        )
+        if resp.status_code == 304:
+            layers = entry[2]
+            _set_cached_layers(
+                key, (time.monotonic() + cache_config.ttl, entry[1], layers)
+            )
+            return layers
+
+        # Re-use the (non-paginated) response instead of listing the collections
+        if resp.status_code == 200:
+            body = stac_api_io.json_loads(resp.text)
+            if not any(link.get("rel") == "next" for link in body.get("links", [])):
+                collections = [
+                    Collection.from_dict(c, preserve_dict=False)
+                    for c in body["collections"]
+                ]
 
-    stac_api_io = StacApiIO(
-        max_retries=Retry(
-            total=retry_config.retry,
-            backoff_factor=retry_config.retry_factor,
+    layers, revalidate = _get_layers(
+        url,
+        stac_api_io,
+        supported_tms or morecantile_tms,
+        collections=collections,
+    )
+    _set_cached_layers(
+        key,
+        (
+            time.monotonic() + cache_config.ttl,
+            etags.get(collections_href) if revalidate else None,
+            layers,
         ),
-        headers=headers,
     )
-    catalog = Client.open(url, stac_io=stac_api_io)
 
-    layers: Dict[str, LayerDict] = {}
-    for collection in catalog.get_collections():
-        spatial_extent = collection.extent.spatial
-        temporal_extent = collection.extent.temporal
-
-        if "renders" in collection.extra_fields:
-            for name, render in collection.extra_fields["renders"].items():
-
-                tilematrixsets = render.pop("tilematrixsets", None)
-                output_format = render.pop("format", None)
-                aggregation = render.pop("aggregation", None)
-
-                _ = render.pop("minmax_zoom", None)  # Not Used
-                _ = render.pop("title", None)  # Not Used
-
-                # see https://github.com/developmentseed/eoAPI-vito/issues/9#issuecomment-2034025021
-                render_title = f"{collection.id}_{name}"
-                layer = {
-                    "id": render_title,
-                    "collection": collection.id,
-                    "bbox": [-180, -90, 180, 90],
-                    "style": "default",
-                    "render": render,
-                }
-                if output_format:
-                    layer["format"] = output_format
-
-                if spatial_extent:
-                    layer["bbox"] = spatial_extent.bboxes[0]
-
-                # NB. The WMTS spec is contradictory re. the multiplicity
-                # relationships between Layer and TileMatrixSetLink, and
-                # TileMatrixSetLink and tileMatrixSet (URI).
-                # WMTS only support 1 set of limits for a TileMatrixSet
-                if tilematrixsets:
-                    if len(tilematrixsets) == 1:
-                        layer["tilematrixsets"] = {
-                            tms_id: _tms_limits(
-                                supported_tms.get(tms_id), layer["bbox"], zooms=zooms
-                            )
-                            for tms_id, zooms in tilematrixsets.items()
-                        }
-                    else:
-                        layer["tilematrixsets"] = {
-                            tms_id: None for tms_id, _ in tilematrixsets.items()
-                        }
+    return layers
 
-                else:
-                    tilematrixsets = supported_tms.list()
-                    if len(tilematrixsets) == 1:
-                        layer["tilematrixsets"] = {
-                            tms_id: _tms_limits(
-                                supported_tms.get(tms_id), layer["bbox"]
-                            )
-                            for tms_id in tilematrixsets
-                        }
-                    else:
-                        layer["tilematrixsets"] = {
-                            tms_id: None for tms_id in tilematrixsets
-                        }
-
-                if (
-                    "cube:dimensions" in collection.extra_fields
-                    and "time" in collection.extra_fields["cube:dimensions"]
-                ):
-                    layer["time"] = [
-                        python_datetime.datetime.strptime(
-                            t,
-                            "%Y-%m-%dT%H:%M:%SZ",
-                        ).strftime("%Y-%m-%d")
-                        for t in collection.extra_fields["cube:dimensions"]["time"][
-                            "values"
-                        ]
-                    ]
-                elif aggregation and aggregation["name"] == "datetime_frequency":
-                    datetime_aggregation = catalog.get_aggregation(
-                        collection_id=collection.id,
-                        aggregation="datetime_frequency",
-                        aggregation_params=aggregation["params"],
-                    )
-                    layer["time"] = [
-                        python_datetime.datetime.strptime(
-                            t["key"],
-                            "%Y-%m-%dT%H:%M:%S.000Z",
-                        ).strftime("%Y-%m-%d")
-                        for t in datetime_aggregation
-                        if t["frequency"] > 0
-                    ]
-                elif intervals := temporal_extent.intervals:
-                    start_date = intervals[0][0]
-                    end_date = (
-                        intervals[0][1]
-                        if intervals[0][1]
-                        else python_datetime.datetime.now(python_datetime.timezone.utc)
-                    )
 
-                    layer["time"] = [
-                        (start_date + python_datetime.timedelta(days=x)).strftime(
-                            "%Y-%m-%d"
-                        )
-                        for x in range(0, (end_date - start_date).days + 1)
-                    ]
+def _has_static_times(collection: Collection) -> bool:
+    """Check if the Layers TIME values only depend on the Collection document.
 
-                render = layer["render"] or {}
+    Times from the `datetime_frequency` aggregation depend on the Items and
+    open-ended temporal extents on the current date, so Layers using them
+    can't be revalidated with the `/collections` ETag.
 
-                # special encoding for rescale
-                # Per Specification, the rescale entry is a 2d array in form of `[[min, max], [min,max]]`
-                # We need to convert this to `['{min},{max}', '{min},{max}']` for titiler dependency
-                if rescale := render.pop("rescale", None):
-                    rescales = []
-                    for r in rescale:
-                        if not isinstance(r, str):
-                            rescales.append(",".join(map(str, r)))
-                        else:
-                            rescales.append(r)
+    """
+    if "time" in collection.extra_fields.get("cube:dimensions", {}):
+        return True
 
-                    render["rescale"] = rescales
+    for render in collection.extra_fields.get("renders", {}).values():
+        aggregation = render.get("aggregation")
+        if aggregation and aggregation["name"] == "datetime_frequency":
+            return False
 
-                # special encoding for ColorMaps
-                # Per Specification, the colormap is a JSON object. TiTiler dependency expects a string encoded dict
-                if colormap := render.pop("colormap", None):
-                    if not isinstance(colormap, str):
-                        colormap = json.dumps(colormap)
+    intervals = collection.extent.temporal.intervals
+    return not intervals or intervals[0][1] is not None
 
-                    render["colormap"] = colormap
 
-                qs = urlencode(
-                    [(k, v) for k, v in render.items() if v is not None],
-                    doseq=True,
-                )
-                layer["query_string"] = str(qs)
-
-                layers[render_title] = LayerDict(
-                    id=layer["id"],
-                    collection=layer["collection"],
-                    bbox=layer["bbox"],
-                    format=layer.get("format"),
-                    style=layer["style"],
-                    render=layer.get("render", {}),
-                    tilematrixsets=layer["tilematrixsets"],
-                    time=layer.get("time"),
-                    query_string=layer["query_string"],
-                )
+def _get_layers(
+    url: str,
+    stac_api_io: StacApiIO,
+    supported_tms: TileMatrixSets,
+    collections: Optional[List[Collection]] = None,
+) -> Tuple[Dict[str, LayerDict], bool]:
+    """Get Layers from all the STAC Collections.
 
-    return layers
+    Returns the Layers and whether they can be revalidated with the `/collections`
+    ETag (see `_has_static_times`).
+
+    """
+    catalog = cast(Client, Client.open(url, stac_io=stac_api_io))
+
+    if collections is None:
+        collections = list(catalog.get_collections())
+
+    revalidate = all(_has_static_times(collection) for collection in collections)
+    get_layers = partial(_get_collection_layers, catalog, supported_tms=supported_tms)
+
+    # Collections with `datetime_frequency` aggregation need an extra request
+    # to the STAC API, so we process the collections in parallel.
+    layers: Dict[str, LayerDict] = {}
+    if MOSAIC_THREADS > 1 and len(collections) > 1:
+        with ThreadPoolExecutor(max_workers=MOSAIC_THREADS) as executor:
+            for collection_layers in executor.map(get_layers, collections):
+                layers.update(collection_layers)
+    else:
+        for collection in collections:
+            layers.update(get_layers(collection))
+
+    return layers, revalidate
+
+
+@cached(  # type: ignore
+    TTLCache(maxsize=cache_config.maxsize, ttl=cache_config.ttl),
+    key=lambda url, layer_id, headers=None, supported_tms=None: hashkey(
+        url, layer_id, frozenset((headers or {}).items())
+    ),
+)
+def get_layer(
+    url: str,
+    layer_id: str,
+    headers: Optional[Dict] = None,
+    supported_tms: Optional[TileMatrixSets] = None,
+) -> Optional[LayerDict]:
+    """Get a Layer from its STAC Collection."""
+    supported_tms = supported_tms or morecantile_tms
+
+    # Use the Layers list if it's already cached
+    key = hashkey(url, frozenset((headers or {}).items()))
+    with _layers_cache_lock:
+        entry = _layers_cache.get(key)
+
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[2].get(layer_id)
+
+    catalog = cast(Client, Client.open(url, stac_io=get_stac_api_io(headers)))
+
+    # Layer ids are in form of `{collection.id}_{render name}` and both
+    # can contain `_`, so we try the longest collection ids first. The layer id
+    # comes from the client, so we only try a few of them.
+    parts = layer_id.split("_")
+    for n in range(1, min(len(parts), MAX_LAYER_ID_SPLITS + 1)):
+        collection_id = "_".join(parts[:-n])
+        try:
+            collection = catalog.get_collection(collection_id)
+        except APIError as e:
+            if e.status_code != 404:
+                raise
+            continue
+        # pystac-client raises those when the Collection can't be found or when
+        # the STAC API doesn't conform to the Collections specification
+        except (KeyError, NotImplementedError):
+            continue
+
+        layers = _get_collection_layers(catalog, collection, supported_tms)
+        if layer_id in layers:
+            return layers[layer_id]
+
+    # Fallback to the full Layers list
+    return get_layer_from_collections(url, headers, supported_tms).get(layer_id)
 
 
 @dataclass
@@ -755,6 +1026,238 @@ class OGCWMTSFactory(BaseTilerFactory):
 
     templates: Jinja2Templates = DEFAULT_TEMPLATES
 
+    # Dependencies values resolved from the layers `render` (see `get_layer_params`)
+    _layer_params: TTLCache = field(
+        default_factory=lambda: TTLCache(
+            maxsize=cache_config.maxsize, ttl=cache_config.ttl
+        ),
+        init=False,
+        repr=False,
+    )
+    _layer_params_lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    # Rendered tiles `(content, media_type)` (see `get_cached_tile`)
+    _tiles: TTLCache = field(
+        default_factory=lambda: TTLCache(
+            maxsize=cache_config.maxsize, ttl=cache_config.ttl
+        ),
+        init=False,
+        repr=False,
+    )
+    _tiles_lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    # Tiles read for GetFeatureInfo requests (see `get_feature_info_image`)
+    _feature_info_images: TTLCache = field(
+        default_factory=lambda: TTLCache(
+            maxsize=min(cache_config.maxsize, 16), ttl=cache_config.ttl
+        ),
+        init=False,
+        repr=False,
+    )
+    _feature_info_images_lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    # Rendered GetCapabilities documents (see `get_capabilities`)
+    _capabilities: TTLCache = field(
+        default_factory=lambda: TTLCache(
+            maxsize=min(cache_config.maxsize, 16), ttl=cache_config.ttl
+        ),
+        init=False,
+        repr=False,
+    )
+    _capabilities_lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    @cached_property
+    def tilematrixsets(self) -> List[TileMatrixSet]:
+        """Supported TileMatrixSets."""
+        return [self.supported_tms.get(tms) for tms in self.supported_tms.list()]
+
+    def get_layer_params(self, layer: LayerDict, req: Dict) -> Dict[str, Any]:
+        """Resolve the dependencies from the Layer's `render` and the request parameters.
+
+        The values are the same for every tile of a layer, so they are cached.
+        `pixel_selection` is not resolved here because it holds the mosaic state.
+
+        """
+        color_formula = req.get("color_formula")
+        expression = req.get("expression")
+        key = hashkey(layer["id"], layer["query_string"], color_formula, expression)
+
+        with self._layer_params_lock:
+            if (params := self._layer_params.get(key)) is not None:
+                return params
+
+        query_params = {**(layer.get("render") or {})}
+        if color_formula is not None:
+            query_params["color_formula"] = color_formula
+        if expression is not None:
+            query_params["expression"] = expression
+
+        params = {
+            "query_params": query_params,
+            "layer_params": get_dependency_params(
+                dependency=self.layer_dependency,
+                query_params=query_params,
+            ),
+            "tile_params": get_dependency_params(
+                dependency=self.tile_dependency,
+                query_params=query_params,
+            ),
+            "dataset_params": get_dependency_params(
+                dependency=self.dataset_dependency,
+                query_params=query_params,
+            ),
+            "post_process": get_dependency_params(
+                dependency=self.process_dependency,
+                query_params=query_params,
+            ),
+            "rescale": get_dependency_params(
+                dependency=self.rescale_dependency,
+                query_params=query_params,
+            ),
+            "color_formula": get_dependency_params(
+                dependency=self.color_formula_dependency,
+                query_params=query_params,
+            ),
+            "colormap": get_dependency_params(
+                dependency=self.colormap_dependency,
+                query_params=layer.get("render") or {},
+            ),
+        }
+
+        with self._layer_params_lock:
+            try:
+                self._layer_params[key] = params
+            except ValueError:  # value too large (e.g. cache disabled)
+                pass
+
+        return params
+
+    def get_capabilities(
+        self,
+        request: Request,
+        layers: Dict[str, LayerDict],
+        version: str,
+    ) -> Tuple[bytes, str]:
+        """Render the GetCapabilities document and its ETag.
+
+        Documents are cached and only rendered again when the layers change.
+
+        """
+        service_url = self.url_for(request, "web_map_tile_service")
+        # The document embeds the request URL (e.g. ServiceMetadataURL)
+        key = hashkey(version, str(request.url), service_url)
+        with self._capabilities_lock:
+            entry = self._capabilities.get(key)
+
+        if entry is not None and entry[0] is layers:
+            return entry[1], entry[2]
+
+        template = self.templates.get_template(f"wmts-getcapabilities_{version}.xml")
+        content = template.render(
+            {
+                "request": request,
+                "layers": layers.values(),
+                "service_url": service_url,
+                "tilematrixsets": self.tilematrixsets,
+                "media_types": WMTSMediaType,
+            }
+        ).encode("utf-8")
+        etag = f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+        with self._capabilities_lock:
+            try:
+                self._capabilities[key] = (layers, content, etag)
+            except ValueError:  # value too large (e.g. cache disabled)
+                pass
+
+        return content, etag
+
+    def tile_cache_key(
+        self,
+        request: Request,
+        api_params: APIParams,
+        query_params: Tuple[Tuple[str, str], ...],
+    ) -> Tuple:
+        """Cache key of a tile request.
+
+        Tiles are identified by the STAC API they are read from, the request path
+        and the query parameters used to render them. Repeated parameters (e.g.
+        `bidx` or per-band `rescale`) are order sensitive, so `query_params` must
+        not be sorted or de-duplicated unless the endpoint does the same.
+
+        """
+        return hashkey(
+            api_params.api_url,
+            frozenset((api_params.headers or {}).items()),
+            request.url.path,
+            query_params,
+        )
+
+    def get_cached_tile(
+        self, request: Request, key: Tuple
+    ) -> Optional[Tuple[bytes, str]]:
+        """Get a rendered tile from the cache.
+
+        The cache is bypassed when the client sends `Cache-Control: no-cache`.
+
+        """
+        if "no-cache" in request.headers.get("cache-control", ""):
+            return None
+
+        with self._tiles_lock:
+            return self._tiles.get(key)
+
+    def set_cached_tile(self, key: Tuple, content: bytes, media_type: str) -> None:
+        """Add a rendered tile to the cache."""
+        with self._tiles_lock:
+            try:
+                self._tiles[key] = (content, media_type)
+            except ValueError:  # value too large (e.g. cache disabled)
+                pass
+
+    def get_feature_info_image(
+        self,
+        req: Dict,
+        layer: LayerDict,
+        stac_url: str,
+        headers: Optional[Dict] = None,
+    ) -> ImageData:
+        """Get the (colormapped) tile image used to answer GetFeatureInfo requests.
+
+        Clients usually send many GetFeatureInfo requests for the same tile (e.g. on
+        hover), so the last images are cached and only the `I`/`J` pixel changes.
+
+        """
+        key = hashkey(
+            stac_url,
+            frozenset((headers or {}).items()),
+            layer["id"],
+            frozenset((k, v) for k, v in req.items() if k not in ("i", "j")),
+        )
+        with self._feature_info_images_lock:
+            if (image := self._feature_info_images.get(key)) is not None:
+                return image
+
+        image = self.get_tile(req, layer, stac_url=stac_url, headers=headers)
+        if colormap := self.get_layer_params(layer, req)["colormap"]:
+            image = image.apply_colormap(colormap)
+
+        with self._feature_info_images_lock:
+            try:
+                self._feature_info_images[key] = image
+            except ValueError:  # value too large (e.g. cache disabled)
+                pass
+
+        return image
+
     def get_tile(  # noqa: C901
         self,
         req: Dict,
@@ -778,7 +1281,7 @@ class OGCWMTSFactory(BaseTilerFactory):
             )
 
         tms_id = req["tilematrixset"]
-        if tms_id not in self.supported_tms.list():
+        if tms_id not in self.supported_tms.tms:
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid 'TILEMATRIXSET' parameter: {tms_id}. Should be one of {self.supported_tms.list()}.",
@@ -818,28 +1321,10 @@ class OGCWMTSFactory(BaseTilerFactory):
                     "datetime"
                 ] = f"{start_datetime.strftime('%Y-%m-%dT%H:%M:%SZ')}/{end_datetime.strftime('%Y-%m-%dT%H:%M:%SZ')}"
 
-            query_params = copy(layer.get("render")) or {}
-            if "color_formula" in req:
-                query_params["color_formula"] = req["color_formula"]
-            if "expression" in req:
-                query_params["expression"] = req["expression"]
-
-            layer_params = get_dependency_params(
-                dependency=self.layer_dependency,
-                query_params=query_params,
-            )
-            tile_params = get_dependency_params(
-                dependency=self.tile_dependency,
-                query_params=query_params,
-            )
-            dataset_params = get_dependency_params(
-                dependency=self.dataset_dependency,
-                query_params=query_params,
-            )
-
+            params = self.get_layer_params(layer, req)
             pixel_selection = get_dependency_params(
                 dependency=self.pixel_selection_dependency,
-                query_params=query_params,
+                query_params=params["query_params"],
             )
 
             image, _ = src_dst.tile(
@@ -850,27 +1335,18 @@ class OGCWMTSFactory(BaseTilerFactory):
                 search_query=search_query,
                 pixel_selection=pixel_selection,
                 threads=MOSAIC_THREADS,
-                **tile_params,
-                **layer_params,
-                **dataset_params,
+                **params["tile_params"],
+                **params["layer_params"],
+                **params["dataset_params"],
             )
 
-            if post_process := get_dependency_params(
-                dependency=self.process_dependency,
-                query_params=query_params,
-            ):
+            if post_process := params["post_process"]:
                 image = post_process(image)
 
-            if rescale := get_dependency_params(
-                dependency=self.rescale_dependency,
-                query_params=query_params,
-            ):
+            if rescale := params["rescale"]:
                 image.rescale(rescale)
 
-            if color_formula := get_dependency_params(
-                dependency=self.color_formula_dependency,
-                query_params=query_params,
-            ):
+            if color_formula := params["color_formula"]:
                 image.apply_color_formula(color_formula)
 
         return image
@@ -1093,52 +1569,35 @@ class OGCWMTSFactory(BaseTilerFactory):
                 raise HTTPException(
                     status_code=400, detail="Missing WMTS 'REQUEST' parameter."
                 )
-
-            layers = get_layer_from_collections(
-                url=api_params["api_url"],
-                headers=api_params.get("headers", {}),
-                supported_tms=self.supported_tms,
-            )
+            req_type = request_type.lower()
 
             ###################################################################
             # GetCapabilities request
-            if request_type.lower() == "getcapabilities":
-                return self.templates.TemplateResponse(
-                    request,
-                    name=f"wmts-getcapabilities_{version}.xml",
-                    context={
-                        "request": request,
-                        "layers": [layer for k, layer in layers.items()],
-                        "service_url": self.url_for(request, "web_map_tile_service"),
-                        "tilematrixsets": [
-                            self.supported_tms.get(tms)
-                            for tms in self.supported_tms.list()
-                        ],
-                        "media_types": WMTSMediaType,
-                    },
+            if req_type == "getcapabilities":
+                layers = get_layer_from_collections(
+                    url=api_params.api_url,
+                    headers=api_params.headers,
+                    supported_tms=self.supported_tms,
+                )
+
+                content, etag = self.get_capabilities(request, layers, version)
+                if etag in (
+                    t.strip()
+                    for t in request.headers.get("if-none-match", "").split(",")
+                ):
+                    return Response(status_code=304, headers={"ETag": etag})
+
+                return Response(
+                    content,
                     media_type=MediaType.xml.value,
+                    headers={"ETag": etag},
                 )
 
             ###################################################################
             # GetTile Request
-            elif request_type.lower() == "gettile":
-                # List of required parameters (styles and crs are excluded)
-                req_keys = {
-                    "service",
-                    "request",
-                    "version",
-                    "layer",
-                    "style",
-                    "format",
-                    "tilematrixset",
-                    "tilematrix",
-                    "tilerow",
-                    "tilecol",
-                }
-
-                intrs = set(req.keys()).intersection(req_keys)
-                missing_keys = req_keys.difference(intrs)
-                if len(missing_keys) > 0:
+            elif req_type == "gettile":
+                missing_keys = WMTS_REQUIRED_PARAMS[req_type] - req.keys()
+                if missing_keys:
                     raise HTTPException(
                         status_code=400,
                         detail=f"Missing '{request_type}' parameters: {missing_keys}",
@@ -1150,16 +1609,25 @@ class OGCWMTSFactory(BaseTilerFactory):
                         detail=f"Invalid 'FORMAT' parameter: {req['format']}. Should be one of {self.supported_format}.",
                     )
 
-                output_format = ImageType(WMTSMediaType(req["format"]).name)
+                output_format = _wmts_image_type(req["format"])
 
-                if req["layer"] not in layers:
+                layer = get_layer(
+                    url=api_params.api_url,
+                    layer_id=req["layer"],
+                    headers=api_params.headers,
+                    supported_tms=self.supported_tms,
+                )
+                if not layer:
+                    layers = get_layer_from_collections(
+                        url=api_params.api_url,
+                        headers=api_params.headers,
+                        supported_tms=self.supported_tms,
+                    )
                     raise HTTPException(
                         status_code=400,
                         detail=f"Invalid 'LAYER' parameter: {req['layer']}. Should be one of {list(layers)}.",
                     )
 
-                layer = layers[req["layer"]]
-
                 style = layer.get("style", "default").lower()
                 req_style = req.get("style") or "default"
                 if req_style != style:
@@ -1168,19 +1636,28 @@ class OGCWMTSFactory(BaseTilerFactory):
                         detail=f"Invalid STYLE parameters {req_style} for layer {layer['id']}",
                     )
 
+                # `req` only keeps the last value of each (case-insensitive) parameter
+                key = self.tile_cache_key(
+                    request, api_params, tuple(sorted(req.items()))
+                )
+                if cached_tile := self.get_cached_tile(request, key):
+                    content, media_type = cached_tile
+                    return Response(content, media_type=media_type)
+
                 image = self.get_tile(
                     req,
                     layer,
-                    stac_url=api_params["api_url"],
-                    headers=api_params.get("headers", {}),
+                    stac_url=api_params.api_url,
+                    headers=api_params.headers,
                 )
 
-                colormap = get_dependency_params(
-                    dependency=self.colormap_dependency,
-                    query_params={"colormap": req["colormap"]}
-                    if "colormap" in req
-                    else layer.get("render") or {},
-                )
+                if "colormap" in req:
+                    colormap = get_dependency_params(
+                        dependency=self.colormap_dependency,
+                        query_params={"colormap": req["colormap"]},
+                    )
+                else:
+                    colormap = self.get_layer_params(layer, req)["colormap"]
 
                 content, media_type = render_image(
                     image,
@@ -1188,30 +1665,15 @@ class OGCWMTSFactory(BaseTilerFactory):
                     colormap=colormap,
                     add_mask=True,
                 )
+                self.set_cached_tile(key, content, media_type)
 
                 return Response(content, media_type=media_type)
 
             ###################################################################
             # GetFeatureInfo Request
-            elif request_type.lower() == "getfeatureinfo":
-                req_keys = {
-                    "service",
-                    "request",
-                    "version",
-                    "layer",
-                    "style",
-                    # "format",
-                    "tilematrixset",
-                    "tilematrix",
-                    "tilerow",
-                    "tilecol",
-                    "i",
-                    "j",
-                    "infoformat",
-                }
-                intrs = set(req.keys()).intersection(req_keys)
-                missing_keys = req_keys.difference(intrs)
-                if len(missing_keys) > 0:
+            elif req_type == "getfeatureinfo":
+                missing_keys = WMTS_REQUIRED_PARAMS[req_type] - req.keys()
+                if missing_keys:
                     raise HTTPException(
                         status_code=400,
                         detail=f"Missing '{request_type}' parameters: {missing_keys}",
@@ -1223,14 +1685,23 @@ class OGCWMTSFactory(BaseTilerFactory):
                         detail=f"Invalid 'InfoFormat' parameter: {req['infoformat']}. Should be 'application/geo+json'.",
                     )
 
-                if req["layer"] not in layers:
+                layer = get_layer(
+                    url=api_params.api_url,
+                    layer_id=req["layer"],
+                    headers=api_params.headers,
+                    supported_tms=self.supported_tms,
+                )
+                if not layer:
+                    layers = get_layer_from_collections(
+                        url=api_params.api_url,
+                        headers=api_params.headers,
+                        supported_tms=self.supported_tms,
+                    )
                     raise HTTPException(
                         status_code=400,
                         detail=f"Invalid 'LAYER' parameter: {req['layer']}. Should be one of {list(layers)}.",
                     )
 
-                layer = layers[req["layer"]]
-
                 style = layer.get("style", "default").lower()
                 req_style = req.get("style") or "default"
                 if req_style != style:
@@ -1239,34 +1710,29 @@ class OGCWMTSFactory(BaseTilerFactory):
                         detail=f"Invalid STYLE parameters {req_style} for layer {layer['id']}",
                     )
 
-                image = self.get_tile(
+                image = self.get_feature_info_image(
                     req,
                     layer,
-                    stac_url=api_params["api_url"],
-                    headers=api_params.get("headers", {}),
-                )
-
-                colormap = get_dependency_params(
-                    dependency=self.colormap_dependency,
-                    query_params=layer.get("render") or {},
+                    stac_url=api_params.api_url,
+                    headers=api_params.headers,
                 )
-                if colormap:
-                    image = image.apply_colormap(colormap)
 
                 # output_format = ImageType(WMTSMediaType(req["format"]).name)
 
                 i = int(req["i"])
                 j = int(req["j"])
 
-                ys, xs = rowcol_to_coords(image.transform, [j], [i])
-                xs_wgs84, ys_wgs84 = transform_points(image.crs, "epsg:4326", xs, ys)
+                # Center of the (i, j) pixel (tiles always have a CRS)
+                x, y = image.transform @ (i + 0.5, j + 0.5)
+                crs = image.crs.to_wkt()  # type: ignore[union-attr]
+                lon, lat = _wgs84_transformer(crs).transform(x, y)
 
                 geojson = {
                     "type": "Feature",
                     "id": layer["id"],
                     "geometry": {
                         "type": "Point",
-                        "coordinates": (xs_wgs84[0], ys_wgs84[0]),
+                        "coordinates": (lon, lat),
                     },
                     "properties": {
                         "values": image.data[:, j, i].tolist(),
@@ -1280,7 +1746,7 @@ class OGCWMTSFactory(BaseTilerFactory):
                         "tileCol": req["tilecol"],
                     },
                 }
-                return GeoJSONResponse(geojson)
+                return ORJSONGeoJSONResponse(geojson)
 
             else:
                 raise HTTPException(
@@ -1365,13 +1831,20 @@ class OGCWMTSFactory(BaseTilerFactory):
             env=Depends(self.environment_dependency),
         ):
             """OGC WMTS GetTile (REST encoding)"""
+            key = self.tile_cache_key(
+                request, api_params, tuple(request.query_params.multi_items())
+            )
+            if cached_tile := self.get_cached_tile(request, key):
+                content, media_type = cached_tile
+                return Response(content, media_type=media_type)
+
             search_query = {"collections": [collectionId], "datetime": timeId}
 
             tms = self.supported_tms.get(tileMatrixSetId)
-            with rasterio.Env(**env):
+            with rasterio.Env(**env) if env else nullcontext():
                 with self.reader(
-                    url=api_params["api_url"],
-                    headers=api_params.get("headers", {}),
+                    url=api_params.api_url,
+                    headers=api_params.headers,
                     tms=tms,
                     reader_options={**reader_params},
                     **backend_params,
@@ -1412,5 +1885,6 @@ class OGCWMTSFactory(BaseTilerFactory):
                 colormap=colormap,
                 **render_params,
             )
+            self.set_cached_tile(key, content, media_type)
 
             return Response(content, media_type=media_type)
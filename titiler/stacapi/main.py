@@ -18,12 +18,17 @@ from titiler.core.resources.enums import OptionalHeader
 from titiler.mosaic.errors import MOSAIC_STATUS_CODES
 from titiler.stacapi import __version__ as titiler_stacapi_version
 from titiler.stacapi import models
-from titiler.stacapi.dependencies import ItemIdParams, OutputType, STACApiParams
+from titiler.stacapi.dependencies import (
+    APIParams,
+    ItemIdParams,
+    OutputType,
+    STACApiParams,
+)
 from titiler.stacapi.enums import MediaType
 from titiler.stacapi.factory import MosaicTilerFactory, OGCWMTSFactory
 from titiler.stacapi.reader import STACReader
 from titiler.stacapi.settings import ApiSettings, STACAPISettings
-from titiler.stacapi.utils import create_html_response
+from titiler.stacapi.utils import JinjaBytecodeCache, create_html_response
 
 settings = ApiSettings()
 stacapi_config = STACAPISettings()
@@ -38,7 +43,12 @@ templates_location: List[Any] = (
 templates_location.append(jinja2.PackageLoader(__package__, "templates"))
 templates_location.append(jinja2.PackageLoader("titiler.core", "templates"))
 
-jinja2_env = jinja2.Environment(loader=jinja2.ChoiceLoader(templates_location))
+jinja2_env = jinja2.Environment(
+    loader=jinja2.ChoiceLoader(templates_location),
+    bytecode_cache=JinjaBytecodeCache(settings.jinja_cache_dir)
+    if settings.jinja_cache_dir
+    else None,
+)
 templates = Jinja2Templates(env=jinja2_env)
 
 
@@ -60,8 +70,9 @@ app = FastAPI(
     root_path=settings.root_path,
 )
 
-# We store the STAC API url in the application state
+# We store the STAC API url (and the default STAC API parameters) in the application state
 app.state.stac_url = stacapi_config.stac_api_url
+app.state.api_params = APIParams(api_url=stacapi_config.stac_api_url)
 
 add_exception_handlers(app, DEFAULT_STATUS_CODES)
 add_exception_handlers(app, MOSAIC_STATUS_CODES)
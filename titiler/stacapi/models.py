@@ -6,7 +6,7 @@ see: https://github.com/developmentseed/ogcapi-pydantic
 
 """
 
-from typing import Dict, List, Optional, TypedDict, Union
+from typing import Dict, List, Optional, Sequence, TypedDict, Union
 
 from geojson_pydantic import Feature, Point
 from pydantic import BaseModel, Field
@@ -119,5 +119,5 @@ class LayerDict(TypedDict, total=False):
     style: str
     render: Optional[Dict]
     tilematrixsets: Dict
-    time: Optional[List[str]]
+    time: Optional[Sequence[str]]
     query_string: str
@@ -61,12 +61,19 @@ class Client(pystac_client.Client):
     def get_supported_aggregations(self) -> List[str]:
         """Get the supported aggregation types.
 
+        The list is fetched once per Client and re-used by `get_aggregation`.
+
         Returns:
             List[str]: The supported aggregations.
         """
-        response = self._stac_io.read_json(self.get_aggregations_link())
-        aggregations = response.get("aggregations", [])
-        return [agg["name"] for agg in aggregations]
+        supported: Optional[List[str]] = getattr(self, "_supported_aggregations", None)
+        if supported is None:
+            response = self._stac_io.read_json(self.get_aggregations_link())
+            aggregations = response.get("aggregations", [])
+            supported = [agg["name"] for agg in aggregations]
+            self._supported_aggregations = supported
+
+        return supported
 
     def get_aggregations_link(self) -> Optional[pystac.Link]:
         """Returns this client's aggregations link.
@@ -16,6 +16,8 @@ class ApiSettings(BaseSettings):
     root_path: str = ""
     debug: bool = False
     template_directory: Optional[str] = None
+    # Directory to store compiled templates (Jinja bytecode cache)
+    jinja_cache_dir: Optional[str] = None
 
     model_config = {
         "env_prefix": "TITILER_STACAPI_API_",
@@ -4,13 +4,49 @@ Code from titiler.pgstac and titiler.cmr, MIT License.
 
 """
 
+import os
 import re
 import time
-from typing import Any, List, Optional
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
 
+import requests
+from jinja2 import FileSystemBytecodeCache
+from jinja2.bccache import Bucket
 from morecantile import TileMatrixSet
+from pystac_client.stac_api_io import StacApiIO
+from requests.adapters import HTTPAdapter
+from rio_tiler.constants import MAX_THREADS
 from starlette.requests import Request
 from starlette.templating import Jinja2Templates, _TemplateResponse
+from typing_extensions import Final
+from urllib3 import Retry
+
+from titiler.stacapi.settings import RetrySettings
+
+retry_config = RetrySettings()
+
+
+class JinjaBytecodeCache(FileSystemBytecodeCache):
+    """Jinja bytecode cache, creating its directory on first write."""
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        """Store compiled template."""
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
 
 
 def create_html_response(
@@ -66,6 +102,58 @@ def create_html_response(
     )
 
 
+MOSAIC_THREADS: Final[int] = int(os.getenv("MOSAIC_CONCURRENCY", MAX_THREADS))
+
+# Mosaic and WMTS layers requests are sent from up to `MOSAIC_THREADS` threads
+POOL_MAXSIZE = max(MOSAIC_THREADS, 10)
+
+
+@lru_cache(maxsize=32)
+def _stac_api_io(headers: FrozenSet[Tuple[str, str]]) -> StacApiIO:
+    max_retries = Retry(
+        total=retry_config.retry,
+        backoff_factor=retry_config.retry_factor,
+    )
+    stac_api_io = StacApiIO(max_retries=max_retries, headers=dict(headers))
+
+    # Make sure the connection pool can keep one connection per thread
+    adapter = HTTPAdapter(max_retries=max_retries, pool_maxsize=POOL_MAXSIZE)
+    stac_api_io.session.mount("http://", adapter)
+    stac_api_io.session.mount("https://", adapter)
+
+    return stac_api_io
+
+
+def get_stac_api_io(headers: Optional[Dict] = None) -> StacApiIO:
+    """Return a StacApiIO shared between calls using the same headers.
+
+    Re-using the StacApiIO (and its underlying requests session) lets us keep
+    the HTTP connections to the STAC API open between requests.
+
+    """
+    return _stac_api_io(frozenset((headers or {}).items()))
+
+
+def stac_api_get(
+    stac_api_io: StacApiIO,
+    href: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> requests.Response:
+    """Send a GET request with the StacApiIO session and return the raw response.
+
+    Unlike `StacApiIO.read_text`, non-200 responses (e.g. `304 Not Modified`) and
+    the response headers are returned to the caller. The StacApiIO parameters,
+    headers, request modifier and timeout still apply.
+
+    """
+    request = requests.Request(method="GET", url=href, headers=headers)
+    if stac_api_io._req_modifier:
+        request = stac_api_io._req_modifier(request) or request
+
+    prepped = stac_api_io.session.prepare_request(request)
+    return stac_api_io.session.send(prepped, timeout=stac_api_io.timeout)
+
+
 # This code is copied from marblecutter
 #  https://github.com/mojodna/marblecutter/blob/master/marblecutter/stats.py
 # License:
@@ -93,10 +181,100 @@ class Timer(object):
         return time.time() - self.start
 
 
+class DateRange(Sequence[str]):
+    """Lazy sequence of consecutive `%Y-%m-%d` dates."""
+
+    def __init__(self, start: date, days: int):
+        """Dates from `start` to `start + (days - 1)`."""
+        self.start = start
+        self.days = max(days, 0)
+
+    def __len__(self) -> int:
+        """Number of dates."""
+        return self.days
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        """Date at index."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.days))]
+
+        if index < 0:
+            index += self.days
+
+        if not 0 <= index < self.days:
+            raise IndexError("DateRange index out of range")
+
+        return (self.start + timedelta(days=index)).isoformat()
+
+    def __contains__(self, value: object) -> bool:
+        """Check if a `%Y-%m-%d` date is in the range without listing all dates."""
+        if not isinstance(value, str) or len(value) != 10:
+            return False
+
+        try:
+            day = date.fromisoformat(value)
+        except ValueError:
+            return False
+
+        return 0 <= (day - self.start).days < self.days
+
+    def __repr__(self) -> str:
+        """DateRange representation."""
+        return f"DateRange(start={self.start!r}, days={self.days})"
+
+
+class DateList(Sequence[str]):
+    """Sequence of `%Y-%m-%d` dates with constant time membership check."""
+
+    def __init__(self, dates: Iterable[str]):
+        """Dates from an iterable."""
+        self.dates: Tuple[str, ...] = tuple(dates)
+        self._dates: FrozenSet[str] = frozenset(self.dates)
+
+    def __len__(self) -> int:
+        """Number of dates."""
+        return len(self.dates)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        """Date at index."""
+        if isinstance(index, slice):
+            return list(self.dates[index])
+
+        return self.dates[index]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the dates."""
+        return iter(self.dates)
+
+    def __contains__(self, value: object) -> bool:
+        """Check if a date is in the list."""
+        return isinstance(value, str) and value in self._dates
+
+    def __repr__(self) -> str:
+        """DateList representation."""
+        return f"DateList({list(self.dates)!r})"
+
+
 def _tms_limits(
     tms: TileMatrixSet,
-    bounds: List[float],
-    zooms: Optional[List[int]] = None,
+    bounds: Sequence[float],
+    zooms: Optional[Sequence[int]] = None,
 ) -> List:
     if zooms:
         minzoom, maxzoom = zooms